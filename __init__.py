@@ -11,9 +11,10 @@ from . import sound
 from . import shadows
 from .shadows import Shadow
 from . import gametools
+from . import statemanager
 from .monitoring import Monitor
 
-from .canonical import arrow_cursor, hand_cursor
+from .canonical import arrow_cursor, hand_cursor, batch
 
 #Import elements classes
 from .elements import Alert, AlertWithChoices, ArrowButton, Box, Button, DropDownList, Image, Line
@@ -22,7 +23,7 @@ from .elements import Checkbox, Radio, SwitchButton, SwitchButtonWithText, DropD
 from .elements import ColorPicker, ColorPickerRGB, ColorPickerPredefined, ImageButton, HeterogeneousTexts
 from .elements import TextAndImageButton, Lifebar, VerticalLifebar, DeadButton, AnimatedGif, WaitingBar, OutlinedText
 from .elements import TogglablesPool, Labelled, LabelledColorPicker, Group, ShowFPS, TkDialog, DiscreteLifebar
-from .elements import ListView, Sketch
+from .elements import ListView, Sketch, BitmapText
 __all__ = [
     "Alert",
     "AlertWithChoices",
@@ -62,7 +63,8 @@ __all__ = [
     "ShowFPS",
     "TkDialog",
     "DiscreteLifebar",
-    "ListView"
+    "ListView",
+    "BitmapText"
 ]
 
 #Import styling functions
@@ -70,6 +72,8 @@ from .themes import theme_classic, theme_human, theme_round, theme_simple, theme
 from .themes import theme_round_gradient, theme_round2, theme_text_outlined
 from .themes import theme_text_dark, theme_game1, set_style_attr, refresh_all_elements_style, get_theme_bck_color, get_theme_main_bck_color
 from .styles import get_default_font, set_default_font, get_text_size, get_text_height
+from .styles import set_surface_cache_size, get_surface_cache_stats, set_text_cache_size, get_text_cache_stats
+from .diskcache import set_disk_cache, clear_disk_cache, get_disk_cache_stats
 
 __all__.extend([
     "theme_classic",
@@ -90,7 +94,14 @@ __all__.extend([
     "get_default_font",
     "set_default_font",
     "get_text_size",
-    "get_text_height"
+    "get_text_height",
+    "set_surface_cache_size",
+    "get_surface_cache_stats",
+    "set_text_cache_size",
+    "get_text_cache_stats",
+    "set_disk_cache",
+    "clear_disk_cache",
+    "get_disk_cache_stats"
 ])
 
 
@@ -15,8 +15,12 @@ of your element in elements.py. <br><br>
 """
 import math
 import pygame
+from contextlib import contextmanager
 from . import sorting
 from . import shadows
+from . import spatial
+from . import traversal
+from . import statemanager
 from . import parameters as p
 from . import loops
 from . import graphics
@@ -46,6 +50,102 @@ def get_blit_rects(parent_rect:Optional[pygame.Rect],
         return clip, area
 
 
+@contextmanager
+def batch():
+    """Context manager deferring the regeneration of the surfaces and the sorting of the elements
+    until the end of the block, e.g. when building or restyling a menu :
+        with thorpy.batch():
+            ...
+    Within the block, the elements whose surfaces are regenerated (set_size, set_style_attr, set_text...)
+    and the parents to resort are only recorded. At the end, each recorded element is regenerated once,
+    then each recorded parent is resorted once, deepest elements first. Sizes and positions of the modified
+    elements are thus only up to date after the block. However, the recorded changes of an element and of its
+    descendants are performed as soon as they are read by thorpy : when sort_children is called on the element
+    (the sort itself is not deferred), when it is resized by set_size and when it gets a shadow."""
+    p.batch_depth += 1
+    try:
+        yield
+    finally:
+        p.batch_depth -= 1
+        if p.batch_depth == 0:
+            flush_batch()
+
+def flush_batch(root:Optional["Element"]=None)->None:
+    """_Performs the regenerations and sorts recorded during a batch. If <root> is given, only the ones
+    concerning root and its descendants are performed, e.g. because root's surfaces are read right now."""
+    if not(p.batch_generation or p.batch_resort):
+        return
+    depth, flushing = p.batch_depth, p.batch_flushing
+    p.batch_depth = 0
+    p.batch_flushing = True #resorts are still deferred, so that each parent is resorted once
+    subtree = set(root.get_all_descendants()) if root else None
+    try:
+        while True:
+            elements = [e for e in p.batch_generation if subtree is None or e in subtree]
+            to_resort = [e for e in p.batch_resort if subtree is None or e in subtree]
+            if not elements and not to_resort:
+                break
+            for e in elements:
+                del p.batch_generation[e]
+                e.generate_surfaces()
+            if to_resort:
+                e = max(to_resort, key=get_depth) #children are resorted before their parents
+                del p.batch_resort[e]
+                e.resort_now()
+    finally:
+        p.batch_depth, p.batch_flushing = depth, flushing
+
+def get_depth(element:"Element")->int:
+    """_Returns the number of ancestors of <element>."""
+    depth = 0
+    while element.parent:
+        depth += 1
+        element = element.parent
+    return depth
+
+
+class LazySurfaces(dict):
+    """_Dict of the surfaces (or shadows) of an element, per state. The states that are pending
+    (see parameters.lazy_surfaces) are generated the first time they are accessed."""
+
+    def __init__(self, element:"Element", states:Dict):
+        dict.__init__(self, states)
+        self.element = element
+
+    def __missing__(self, state:str):
+        if state in self.element.pending_states:
+            self.element.generate_pending_state(state)
+            return dict.__getitem__(self, state)
+        raise KeyError(state)
+
+    def get(self, state:str, default=None):
+        if state in self.element.pending_states:
+            self.element.generate_pending_state(state)
+        return dict.get(self, state, default)
+
+
+class LayerSurface:
+    """_Surface of a cached layer, allocated at the size of the layer only. The elements blit onto it
+    in screen coordinates, which are offset to the topleft corner of the layer. The layer is composited
+    with premultiplied alpha, so that blitting it with pygame.BLEND_PREMULTIPLIED gives the same result as
+    drawing its elements directly. Only blit is provided : the elements that draw themselves in another way
+    are not drawn in layers (see Element.can_be_drawn_in_layer)."""
+
+    def __init__(self, rect:pygame.Rect):
+        self.surface = pygame.Surface(rect.size, pygame.SRCALPHA)
+        self.x, self.y = rect.topleft
+
+    def blit(self, source:pygame.Surface, dest, area=None, special_flags:int=0)->pygame.Rect:
+        if isinstance(dest, pygame.Rect):
+            dest = dest.move(-self.x, -self.y)
+        else:
+            dest = (dest[0] - self.x, dest[1] - self.y)
+        if not special_flags: #blending of a straight alpha surface
+            source = graphics.get_premultiplied(source)
+            special_flags = pygame.BLEND_PREMULTIPLIED
+        return self.surface.blit(source, dest, area, special_flags).move(self.x, self.y)
+
+
 class SortOptions:
 
     def __init__(self,
@@ -93,6 +193,7 @@ class Element:
     style_locked: Optional["BaseStyle"] = None
     # hand_cursor: Optional["BaseStyle"] = None
     hand_cursor:bool = False
+    hover_cursor:Optional[pygame.Cursor] = None #cursor shown when hovered, instead of the hand cursor
     multi_shadows: bool = False
 
     @classmethod
@@ -127,14 +228,15 @@ class Element:
                                                             "hover":None,
                                                             "pressed":None,
                                                             "locked":None}
-        self.surfaces:Dict[str,List[pygame.Surface]] = {"normal":[],
-                                                        "hover":[],
-                                                        "pressed":[],
-                                                        "locked":[]}
-        self.shadows:Dict[str,List[Optional[pygame.Surface]]] = {"normal":[],
-                                                                "hover":[],
-                                                                "pressed":[],
-                                                                "locked":[]}
+        self.pending_states:set = set() #states whose surfaces are generated only when needed
+        self.surfaces:Dict[str,List[pygame.Surface]] = LazySurfaces(self, {"normal":[],
+                                                                          "hover":[],
+                                                                          "pressed":[],
+                                                                          "locked":[]})
+        self.shadows:Dict[str,List[Optional[pygame.Surface]]] = LazySurfaces(self, {"normal":[],
+                                                                                   "hover":[],
+                                                                                   "pressed":[],
+                                                                                   "locked":[]})
         self.multi_shadows:bool = self.__class__.multi_shadows
         self.state:str = "unactive"
         self.refresh_surfaces:Callable = self.refresh_surfaces_build #type:ignore
@@ -168,6 +270,14 @@ class Element:
         self.last_player:Optional[loops.Loop] = None
         self.id:int = Element.current_id
         self.has_surfaces_generated:bool = False
+        self.is_layer:bool = False #if True, self and its descendants are drawn from a cached surface
+        self.layer:Optional[pygame.Surface] = None
+        self.layer_rect:Optional[pygame.Rect] = None
+        self.hit_index:Optional[spatial.SpatialIndex] = None
+        self.compiled_tree:Optional[traversal.CompiledTree] = None
+        self.relative_positioning:bool = False #if True, children follow the moves of self lazily
+        self.pending_dx:int = 0 #move of self not yet applied to its children
+        self.pending_dy:int = 0
         self.fit_to_children = self.englobe_children #just an alias
         Element.current_id += 1
 
@@ -411,10 +521,69 @@ class Element:
         <dx> : the number of pixels along x axis.
         <dy> : the number of pixels along y axis.
         """
+        if not(dx or dy):
+            return
+        if self.relative_positioning and self.children:
+            self.move_alone(dx, dy)
+            return
+        if self.compiled_tree and not self.compiled_tree.must_rebuild:
+            self.compiled_tree.move(self, dx, dy)
+            return
+        layer = self.layer
+        self.mark_dirty()
         self.rect.x += dx #type:ignore #Pygame performs the cast
         self.rect.y += dy #type:ignore #Pygame performs the cast
+        self.mark_dirty()
         for e in self.children:
             e.move(dx,dy)
+        if layer and not self.cannot_draw_outside: #the whole layer moved : its cached surface is still valid
+            self.layer = layer
+            self.layer_rect.move_ip(dx,dy) #type:ignore #guaranteed when layer is defined
+
+    def move_alone(self, dx:Number, dy:Number)->None:
+        """_Moves self and defers the move of its children until their positions are needed."""
+        layer = self.layer
+        self.mark_dirty()
+        x, y = self.rect.topleft
+        self.rect.x += dx #type:ignore #Pygame performs the cast
+        self.rect.y += dy #type:ignore #Pygame performs the cast
+        self.mark_dirty()
+        if not(self.pending_dx or self.pending_dy):
+            p.moved_elements.append(self)
+        dx, dy = self.rect.x - x, self.rect.y - y #children must follow the effective move
+        self.pending_dx += dx
+        self.pending_dy += dy
+        if layer and not self.cannot_draw_outside:
+            self.layer = layer
+            self.layer_rect.move_ip(dx,dy) #type:ignore #guaranteed when layer is defined
+
+    def resolve_children_positions(self)->None:
+        """_Applies the pending move of self to its children."""
+        dx, dy = self.pending_dx, self.pending_dy
+        if dx or dy:
+            self.pending_dx = self.pending_dy = 0
+            layer = self.layer
+            for e in self.children:
+                e.move(dx,dy)
+            if layer: #self's layer moved with self : children are now where the layer shows them
+                self.layer = layer
+
+    def set_relative_positioning(self, value:bool=True, recursive:bool=True)->None:
+        """Set whether the children of self follow its moves lazily. In this mode, moving self costs the
+        same whatever the number of its descendants : their rects are only updated when needed,
+        that is when the element is updated or drawn, or when its children are sorted.
+        This is useful for big panels that are dragged, scrolled or animated.
+        If you read the rect of a descendant right after moving self in your own code,
+        call thorpy.parameters.resolve_positions() before.
+        ***Optional arguments***
+        <value> : (bool) True to use relative positioning.
+        <recursive> : (bool) if True, the mode is also set for all the descendants of self.
+        """
+        p.resolve_positions()
+        self.relative_positioning = value
+        if recursive:
+            for e in self.children:
+                e.set_relative_positioning(value, recursive)
 
     def clamp(self, rect:pygame.Rect)->None:
         """Moves self inside rect argument, using Pygame's clamp function.
@@ -482,7 +651,7 @@ class Element:
         dy = 0 if y is None else y-self.rect.centery
         self.move(dx, dy)
 
-    def center_on(self, what:str|"Element"|pygame.Rect|pygame.Surface)->"Element":
+    def center_on(self, what:"str|Element|pygame.Rect|pygame.Surface")->"Element":
         """Centers the element on another, or on a pygame Surface or Rect.
         <what> : either a pygame Rect, a 2-tuple, a pygame Surface or a thorpy element.
         It is also possible to specify what = 'screen' as a shortcut for screen's rect.
@@ -563,7 +732,9 @@ class Element:
                     self.styles[key].font_auto_multilines_width = w #type:ignore #the if above guarantees styles[key] is a Style instance
         if self.state != "unactive": #self.styles[self.state]: #e.g. ghost has no style
             self.generate_surfaces()
+            self.resolve_generation() #the new size is usually read straight away
         self.rect.center = center
+        self.mark_dirty()
         if adapt_parent and self.parent:
             self.parent.resort()
 
@@ -668,6 +839,14 @@ class Element:
         <grid_type> : if "soft", then cell sizes of the grid are adatable, otherwise they are fixed
         according to the max size of the children.
         """
+        if p.batch_depth: #the sizes of the children are read now : their recorded changes are performed first
+            p.batch_resort.pop(self, None) #sorted right below
+            flush_batch(self)
+            p.batch_resort.pop(self, None) #requested by the descendants, sorted right below as well
+        if margins is None:
+            style = self.get_current_style()
+            margins = style.margins if style else (0,0)
+        self.resolve_children_positions()
         children = [e for e in self.children if not e.ignore_for_sorting]
         # self.sort_options = (mode, align, gap, margins, offset, nx, ny, grid_gaps, horizontal_first, englobe_children)
         self.sort_options = SortOptions(mode, align, gap, margins, offset, nx, ny,
@@ -725,6 +904,13 @@ class Element:
 
     def resort(self)->None:
         """Try to sort using the last parameters as for last call to sort."""
+        if p.batch_depth or p.batch_flushing:
+            p.batch_resort[self] = None
+            return
+        self.resort_now()
+
+    def resort_now(self)->None:
+        """_Sort using the last parameters, even during a batch."""
         if self.sort_options:
             # self.sort_children(*self.sort_options)
             # self.sort_children(*self.sort_options.arguments())
@@ -811,18 +997,32 @@ class Element:
         """_Update state of the element. Return True if element was dragged."""
         if self.state == "locked":
             return False
-        mouse_pos = pygame.mouse.get_pos()
-        mouse_pressed = pygame.mouse.get_pressed()
-        dragged = False #self has been dragged ?
-##        self.being_dragged = False
+        if self.hit_index and self.hit_index.root is self:
+            p.resolve_positions()
+            return self.hit_index.update(mouse_delta)
+        if self.compiled_tree and self.compiled_tree.root is self:
+            p.resolve_positions()
+            return self.compiled_tree.update(mouse_delta)
+        if self.pending_dx or self.pending_dy:
+            self.resolve_children_positions()
         children_dragged = False
         for e in self.children:
             children_dragged += e.update(mouse_delta) #type:ignore #I really want cast from bool to int
+        return self.update_state(mouse_delta, children_dragged)
+
+    def update_state(self, mouse_delta, children_dragged:bool)->bool:
+        """_Update state of the element alone, once its children are updated. Return True if element was dragged."""
+        inputs = p.get_inputs()
+        mouse_pos = inputs.pos
+        mouse_pressed = inputs.buttons
+        dragged = False #self has been dragged ?
+##        self.being_dragged = False
         #Caution : self.state may be changed by children
         really_active = self.state != "unactive" and self.state != "locked"
         if not really_active:
-            self.it += 1
+            self.it += p.steps
         else:
+            old_rect, old_state = self.rect, self.state
             self.rect = self.get_rect()
             if self.rect.collidepoint(mouse_pos):
                 if mouse_pressed[0]: #left click
@@ -835,6 +1035,7 @@ class Element:
                                 # pygame.display.update(self.rect)
                                 self._at_click(**self._at_click_params)
                             self.default_at_click()
+                            statemanager.manager.push_transition("click", self)
                         if not children_dragged:
                             if self.draggable_x or self.draggable_y:
                                 p.element_being_dragged = self #type:ignore #guaranteed
@@ -849,6 +1050,7 @@ class Element:
                         if self.at_unclick:  #type:ignore #called from children classes
                             self.at_unclick(**self.at_unclick_params)
                         self.default_at_unclick()
+                        statemanager.manager.push_transition("unclick", self)
                     elif self.state != "hover":
                         self.i_frame = 0
                         self.state = "hover"
@@ -857,6 +1059,7 @@ class Element:
                         if self.at_hover: #type:ignore #called from children classes
                             self.at_hover(**self.at_hover_params)
                         self.default_at_hover()
+                        statemanager.manager.push_transition("hover", self)
             else: #mouse do not collide with element
                 if self.being_dragged:
                     dragged = False
@@ -870,26 +1073,107 @@ class Element:
                     if self.state == "hover":
                         self.i_frame = 0
                         self.state = "normal"
-                        if self.hand_cursor:
-                            pygame.mouse.set_cursor(arrow_cursor)
                         if self.at_unhover: #type:ignore #called from children classes
                             self.at_unhover(**self.at_unhover_params)
                         self.default_at_unhover()
+                        statemanager.manager.push_transition("unhover", self)
                         self.being_dragged = False
                     if self.state != "normal":
                         self.i_frame = 0
                         self.state = "normal"
-            self.it += 1
-            self.update_iframe()
-        if self.state == "hover" and self.hand_cursor:
-            pygame.mouse.set_cursor(hand_cursor)
+            if self.state != old_state:
+                if p.dirty_rects is not None:
+                    p.dirty_rects.append(self.get_damaged_rect(old_rect))
+                self.mark_dirty()
+            self.advance_animation()
+        if self.state == "hover" or self.being_dragged:
+            self.request_cursor()
         return dragged
    
+    def request_cursor(self)->None:
+        """_Requests the cursor of self (if any) to the state manager for the current frame."""
+        cursor = self.hover_cursor
+        if cursor is None and self.hand_cursor:
+            cursor = hand_cursor
+        if cursor is not None:
+            statemanager.manager.request_cursor(cursor)
+
+    def has_custom_update(self)->bool:
+        """_Returns True if self's class redefines the update method."""
+        return self.__class__.update is not Element.update
+
+    def has_custom_update_no_state_change(self)->bool:
+        """_Returns True if self's class redefines the update_no_state_change method."""
+        return self.__class__.update_no_state_change is not Element.update_no_state_change
+
+    def has_custom_draw(self)->bool:
+        """_Returns True if self's class or self itself redefines the draw method."""
+        return "draw" in self.__dict__ or self.__class__.draw is not Element.draw
+
+    def can_be_drawn_in_layer(self)->bool:
+        """_Returns True if self only draws by blitting surfaces, which is all a LayerSurface provides."""
+        return not self.has_custom_draw() or self.draw == self.do_nothing
+
+    def is_animated(self)->bool:
+        """_Returns True if any of self's styles animates its surfaces."""
+        for style in self.styles.values():
+            if style and style.frame_mod > 0:
+                return True
+        return False
+
+    def has_locked_ancestor(self, root:"Element")->bool:
+        """_Returns True if self or any of its ancestors up to <root> is locked."""
+        e = self
+        while e:
+            if e.state == "locked":
+                return True
+            if e is root:
+                return False
+            e = e.parent
+        return False
+
+    def set_compiled_traversal(self, value:bool=True)->None:
+        """Set whether self's descendants are updated, drawn and moved using flat precompiled lists
+        instead of recursive calls. Call this on the root element, i.e. the one handled by the updater.
+        The lists are automatically rebuilt when children are added or removed anywhere in the tree.
+        This saves a lot of call overhead for deeply nested trees of elements.
+        <value> : (bool) True to use the compiled traversal.
+        """
+        if self.compiled_tree and self.compiled_tree.root is self:
+            for e in self.compiled_tree.nodes:
+                e.compiled_tree = None
+        if value:
+            self.compiled_tree = traversal.CompiledTree(self)
+            self.compiled_tree.rebuild()
+        else:
+            self.compiled_tree = None
+
+    def set_spatial_index(self, value:bool=True, cell_size:int=64)->None:
+        """Set whether a spatial index is used to find the elements under the mouse when self is updated.
+        Call this on the root element, i.e. the one handled by the updater. Each frame, only the elements
+        under the mouse, the ones that were hovered, pressed or dragged and the animated ones are then updated,
+        instead of the whole tree. The index is automatically kept in sync when elements are moved or resized,
+        and when children are added or removed. This is useful for menus containing thousands of elements.
+        ***Optional arguments***
+        <value> : (bool) True to use a spatial index.
+        <cell_size> : (int) size in pixels of the cells of the index.
+        """
+        if self.hit_index and self.hit_index.root is self:
+            for e in self.hit_index.ranks:
+                e.hit_index = None
+        if value:
+            self.hit_index = spatial.SpatialIndex(self, cell_size)
+            self.hit_index.rebuild()
+        else:
+            self.hit_index = None
+
     def update_iframe(self)->None:
         style = self.get_current_style()
         if style and style.frame_mod > 0:
+            p.animating = True
             if self.it % style.frame_mod == 0:
                 self.i_frame += 1
+                self.mark_dirty()
             self.i_frame %= style.nframes
         else:
             self.i_frame = 0
@@ -899,10 +1183,25 @@ class Element:
         """_Visual update only. Call the next frame in the animation."""
         if self.state == "locked":
             return
+        if self.compiled_tree and self.compiled_tree.root is self:
+            p.resolve_positions()
+            self.compiled_tree.update_no_state_change(mouse_delta)
+            return
+        if self.pending_dx or self.pending_dy:
+            self.resolve_children_positions()
         for e in self.children:
             e.update_no_state_change(mouse_delta)
         #self.state may be changed by children
+        self.update_animation()
+
+    def update_animation(self)->None:
+        """_Call the next frame in the animation of self alone."""
         if self.state != "unactive" and self.state != "locked":
+            self.advance_animation()
+
+    def advance_animation(self)->None:
+        """_Advances the animation of self alone by the number of logic steps of the current frame."""
+        for step in range(p.steps):
             self.it += 1
             self.update_iframe()
 
@@ -913,9 +1212,11 @@ class Element:
             states += c.lock_all_and_get_states()
         states += [(self, self.state)]
         self.state = "locked"
+        self.mark_dirty()
         return states
    
     def get_children_rect(self, margins=(0,0))->pygame.Rect:
+        self.resolve_children_positions()
         if not self.children:
             return pygame.Rect(self.rect.center, (1,1))
         r = self.children[0].rect.unionall([e.rect for e in self.children if not e.ignore_for_sorting])
@@ -923,6 +1224,7 @@ class Element:
         return r
 
     def get_rect_with_children(self)->pygame.Rect:
+        self.resolve_children_positions()
         if self.children:
             return self.rect.unionall([e.rect for e in self.children if not e.ignore_for_sorting])
         else:
@@ -945,12 +1247,38 @@ class Element:
             pygame.draw.rect(self.surface, color, e.rect, 1)
         pygame.display.flip()
 
+    def get_damaged_rect(self, rect:Optional[pygame.Rect]=None)->pygame.Rect:
+        """_Returns the screen area covered by self (or by <rect> if given), shadow included."""
+        if rect is None:
+            rect = self.rect
+        style = self.get_current_style()
+        if style and style.shadowgen:
+            shadows = self.shadows.get(self.state)
+            if shadows and shadows[0]:
+                r = shadows[0].get_rect(topleft=rect.topleft).move(style.shadowgen.offset)
+                return r.union(rect)
+        return rect.copy()
+
+    def mark_dirty(self)->None:
+        """_Record that self's look or position changed : the area covered by self is damaged
+        (if a loop is in dirty rects mode) and the cached layers containing self are invalidated."""
+        if p.dirty_rects is not None:
+            p.dirty_rects.append(self.get_damaged_rect())
+        if self.hit_index:
+            self.hit_index.stale.add(self)
+        e = self
+        while e:
+            e.layer = None
+            e = e.parent
+
     def refresh_surfaces_shadow(self)->None:
         if self.multi_shadows:
             for style_name, style in self.styles.items():
+                if style_name in self.pending_states:
+                    continue
                 if style.shadowgen: #type:ignore #guaranteed by construction of the loop
                     # print("generating shadow for state", style_name, "el:", self, "--> size=", self.rect.size)
-                    s = style.shadowgen.generate_image(self.get_frame(style_name, 0)) #type:ignore #guaranteed by construction of the loop
+                    s = style.shadowgen.get_image(self.get_frame(style_name, 0)) #type:ignore #guaranteed by construction of the loop
                     self.shadows[style_name] = [s for surf in self.surfaces[style_name]]
                 else:
                     self.shadows[style_name] = [None for surf in self.surfaces[style_name]]
@@ -958,7 +1286,7 @@ class Element:
             shadowgen_used = None
             style_to_copy = None
             for style_name, style in self.styles.items():
-                if not style:
+                if not style or style_name in self.pending_states:
                     continue
                 if style.shadowgen:
                     if shadowgen_used:
@@ -967,7 +1295,7 @@ class Element:
                     else:
                         # print("generating shadow2 for state", style_name, "el:", self, "--> size=", self.rect.size)
                         # if self.id == 179:assert False
-                        s = style.shadowgen.generate_image(self.get_frame(style_name, 0))
+                        s = style.shadowgen.get_image(self.get_frame(style_name, 0))
                         self.shadows[style_name] = [s for surf in self.surfaces[style_name]]
                         shadowgen_used = style.shadowgen
                         style_to_copy = style_name
@@ -976,17 +1304,54 @@ class Element:
 
     def refresh_surfaces_build(self)->None:
         """_Refresh surfaces using the current style object"""
+        self.pending_states.clear()
         for key, style in self.styles.items():
             if style:
-                self.surfaces[key] = style.generate_images(self.text) #type:ignore #guaranteed by construction of the loop
+                if p.lazy_surfaces and key != "normal" and key != self.state:
+                    self.pending_states.add(key)
+                    dict.pop(self.surfaces, key, None)
+                    dict.pop(self.shadows, key, None)
+                else:
+                    self.surfaces[key] = style.get_images(self.text) #type:ignore #guaranteed by construction of the loop
         self.has_surfaces_generated = True
         self.refresh_surfaces_shadow()
 
+    def generate_pending_state(self, state:str)->None:
+        """_Generates the surfaces and shadows of a state whose generation was deferred."""
+        self.pending_states.discard(state)
+        style = self.styles[state]
+        self.surfaces[state] = style.get_images(self.text) #type:ignore #pending states have a style
+        n = len(self.surfaces[state])
+        if not style.shadowgen: #type:ignore
+            self.shadows[state] = [None]*n
+            return
+        if not self.multi_shadows: #reuse the shadow of the first generated state that has one
+            for name, other in self.styles.items():
+                if other and other.shadowgen and name != state and not(name in self.pending_states):
+                    shadows = dict.get(self.shadows, name)
+                    if shadows:
+                        self.shadows[state] = [shadows[0]]*n
+                        return
+        s = style.shadowgen.get_image(self.surfaces[state][0]) #type:ignore
+        self.shadows[state] = [s]*n
+
+    def warm_up(self, recursive:bool=True)->None:
+        """Generates now the surfaces of the states whose generation was deferred (see parameters.lazy_surfaces).
+        Call it e.g. during a loading screen, so that the first hover or click on the elements is not delayed.
+        <recursive> : (bool) if True, the descendants of self are also warmed up.
+        """
+        for state in list(self.pending_states):
+            self.generate_pending_state(state)
+        if recursive:
+            for e in self.children:
+                e.warm_up(recursive)
+
     def refresh_surfaces_copy(self)->None:
         """_Refresh surfaces using a new style object"""
         if not self.styles["normal"]:
             return
-        s = self.styles["normal"].generate_images(self.text) 
+        self.pending_states.clear()
+        s = self.styles["normal"].get_images(self.text)
         for key in self.styles.keys():
             self.surfaces[key] = s
         self.has_surfaces_generated = True
@@ -1005,13 +1370,15 @@ class Element:
    
     def pump_special_frame(self)->pygame.Surface:
         if self.special_frames:
+            p.animating = True
+            self.mark_dirty()
             return self.special_frames.pop()
         else:
             self.stop_special_frames()
             return self.get_current_frame()
        
     def get_current_shadow_frame(self)->Optional[pygame.Surface]:
-        return self.shadows.get(self.state)[self.i_frame] #type:ignore #guaranteed
+        return self.shadows[self.state][self.i_frame] #type:ignore #guaranteed
    
     def get_rect(self)->pygame.Rect:
         """_Returns (and updates!) the current rect of the element, using its current state."""
@@ -1108,7 +1475,7 @@ class Element:
 ##                self.remove_child(h)
 
     def launch_and_lock_others(self, other, func_before=None, click_outside_cancel=True,
-                                reaction=None, func_after=None)->None:
+                                reaction=None, func_after=None, freeze_others=False)->None:
         """Creates a time loop to interact with this element.
         The element thus 'pops' to the screen for the user.
         The other elements enters in lock mode ; they are drawn to the screen, but not updated according to events.
@@ -1119,13 +1486,18 @@ class Element:
         <func_after> : either None or a function to call after each update and draw of the element.
         <click_outside_cancel> : (bool) if True, the user can discard the popped element.
         <reaction> : either None or a function to call each frame and that takes as only argument the pygame event.
+        <freeze_others> : (bool) if True, the locked elements are drawn once and the screen area they cover
+        is then blitted from a snapshot until self's loop ends, which is much faster for big trees of elements.
+        Use it only if self is not one of these elements and nothing animated is drawn below them.
         """
         tmp = self.state
         states = other.lock_all_and_get_states()
         self.state = tmp #if other is an ancestor, make sure it doesnt lock us.
-        loops.loop_elements(self, [other], func_before, click_outside_cancel, reaction, func_after) #type:ignore #guaranteed
+        loops.loop_elements(self, [other], func_before, click_outside_cancel, reaction, func_after, #type:ignore #guaranteed
+                            freeze_others=freeze_others)
         for element, state in states:
             element.state = state
+            element.mark_dirty()
 
     def launch_nonblocking(self, loop=None, click_outside_cancel=True)->None:
         """Inserts the element in the current loop, so that other elements are still reacting.
@@ -1137,17 +1509,19 @@ class Element:
         if loop is None:
             loop = loops.loops[-1]
         self.loop_give_back = (loop, loop.element, loop.click_outside_cancel)
+        self.mark_dirty()
         loop.to_update.append(loop.element)
         loop.element = self
         loop.click_outside_cancel = click_outside_cancel
 
     def remove_from_loop(self)->None:
         loop, e, click_outside_cancel = self.loop_give_back #type:ignore #if method is called, attr has been set
+        self.mark_dirty()
         loop.to_update.remove(e) #type:ignore #guaranteed
         loop.element = e
         loop.click_outside_cancel = click_outside_cancel
 
-    def get_updater(self, fps=-1, esc_quit=False)->loops.Loop:
+    def get_updater(self, fps=-1, esc_quit=False, dirty_rects_mode=False)->loops.Loop:
         """Returns a thorpy updater object so that you can use thorpy elements in your own loop
         without thinking about how to update and draw thorpy elements. See the tagged examples for
         standard usage.
@@ -1156,9 +1530,14 @@ class Element:
         If fps is negative (which is the case by default), framerate control is unactivated
         (typically, you want it if your application already limitates FPS).
         <esc_quit> : (bool) set to True if you want that the updater exits when user press escape.
+        <dirty_rects_mode> : (bool) set to True if you want that the updater records the list of the screen areas
+        damaged by the elements (see Loop.get_dirty_rects), so that you can call pygame.display.update(rects)
+        instead of pygame.display.flip().
         """
         player = loops.Loop(element=self, fps=fps) #type:ignore #guaranteed
         player.esc_quit = esc_quit
+        if dirty_rects_mode:
+            player.set_dirty_rects_mode(True)
         self.last_player = player
         return player
    
@@ -1176,6 +1555,24 @@ class Element:
     def draw(self)->None:
         """Draws the element according to its current state. Note that in most cases,
         you won't use this method, as the updater of the element will handle it (see tagged example)."""
+        if self.is_layer:
+            if not self.layer:
+                self.build_layer()
+            if self.layer: #the layer is premultiplied (see LayerSurface)
+                self.surface.blit(self.layer, self.layer_rect, special_flags=pygame.BLEND_PREMULTIPLIED) #type:ignore
+                return
+        if self.compiled_tree and self.compiled_tree.root is self:
+            p.resolve_positions()
+            self.compiled_tree.draw()
+            return
+        if self.pending_dx or self.pending_dy:
+            self.resolve_children_positions()
+        self.draw_self()
+        for e in self.children:
+            e.draw()
+
+    def draw_self(self)->None:
+        """_Draws self alone, without its children."""
         if self.must_draw():
             style = self.get_current_style()
             if style:
@@ -1194,8 +1591,40 @@ class Element:
                                           self.rect.move(style.shadowgen.offset)) #type:ignore #guaranteed by the if statement
                     self.surface.blit(self.get_current_frame(), self.rect)
                     self.second_draw(style)
-        for e in self.children:
-            e.draw()
+
+    def set_layer(self, value:bool=True)->None:
+        """Set whether the element and its descendants are drawn as a single cached layer. The layer is rendered
+        once into an offscreen surface which is then blitted each frame, instead of drawing each descendant.
+        The cache is rebuilt automatically when any descendant changes its state, frame, position or surfaces,
+        so this is meant for containers (e.g. Box, TitleBox, Group) whose content is mostly static.
+        The layer is composited with premultiplied alpha : colors are the ones of a direct drawing, up to the
+        rounding of a level or two where semi-transparent surfaces overlap. If a descendant redefines its draw
+        method (and may thus draw otherwise than by blitting surfaces), the element is drawn directly instead.
+        <value> : (bool) True to draw the element as a cached layer.
+        """
+        self.is_layer = value
+        self.layer = None
+        self.children_changed()
+
+    def build_layer(self)->None:
+        """_Render self and its descendants into self.layer, if they can all be drawn in a layer."""
+        descendants = self.get_all_descendants()
+        if not all(e.can_be_drawn_in_layer() for e in descendants[1:]):
+            return
+        rects = [e.get_damaged_rect() for e in descendants]
+        rect = rects[0].unionall(rects)
+        rect = rect.clip(p.screen.get_rect()) #type:ignore #screen is defined now
+        scratch = LayerSurface(rect)
+        old_surfaces = [e.surface for e in descendants]
+        for e in descendants:
+            e.surface = scratch #type:ignore #only blit is called while drawing
+        self.is_layer = False
+        self.draw()
+        self.is_layer = True
+        for e, surface in zip(descendants, old_surfaces):
+            e.surface = surface
+        self.layer = scratch.surface
+        self.layer_rect = rect
 
     def draw_and_display_rect(self, fill_screen_before=None):
         if fill_screen_before:
@@ -1206,8 +1635,24 @@ class Element:
 
     def generate_surfaces(self)->None:
         """Build the element surfaces for each style and refresh the element's rect accordingly."""
+        if p.batch_depth and self.has_surfaces_generated: #regeneration deferred to the end of the batch
+            p.batch_generation[self] = None
+            return
+        self.mark_dirty()
         self.refresh_surfaces()
         self.rect = self.get_rect()
+        self.mark_dirty()
+
+    def resolve_generation(self)->None:
+        """_Generates now the surfaces of the element if their regeneration has been deferred by a batch."""
+        if self in p.batch_generation:
+            del p.batch_generation[self]
+            depth, flushing = p.batch_depth, p.batch_flushing
+            p.batch_depth, p.batch_flushing = 0, True #resorts are still deferred
+            try:
+                self.generate_surfaces()
+            finally:
+                p.batch_depth, p.batch_flushing = depth, flushing
 
     def get_current_frame(self)->pygame.Surface:
         """Returns the image of the element being displayed."""
@@ -1240,6 +1685,8 @@ class Element:
         <states> : a string or a sequence of strings indicating for which states the shadow should be generated.
         <uniform> : (bool) if True and fast is also True, then the shadow wont have per-pixel alpha values.
         """
+        if p.batch_depth: #the shadow is computed from the surfaces, that must be up to date
+            flush_batch(self)
         states = self.get_states_names(states)
         if not shadowgen:
             fast = shadows.auto_set_fast(self, fast)
@@ -1275,6 +1722,8 @@ class Element:
             self.children.append(element)
         else:
             self.children.insert(i, element)
+        element.mark_dirty()
+        self.children_changed()
         if auto_sort:
             self.resort()
 
@@ -1293,13 +1742,17 @@ class Element:
         """
         element.parent = None
         self.children.remove(element)
+        element.mark_dirty()
+        self.children_changed()
         if auto_sort:
             self.sort_children()
 
     def remove_all_children(self, auto_sort:bool=False)->None:
         for e in self.children:
             e.parent = None
+            e.mark_dirty()
         self.children.clear()
+        self.children_changed()
         if auto_sort:
             self.resort()
             # self.sort_children()
@@ -1320,11 +1773,20 @@ class Element:
         """
         i = self.children.index(old_one)
         old_one.parent = None
+        old_one.mark_dirty()
         new_one.parent = self
         self.children[i] = new_one
+        self.children_changed()
         if refresh:
             self.generate_surfaces()
 
+    def children_changed(self)->None:
+        """_Invalidate the structures built from the tree of elements (spatial index, compiled traversal)."""
+        if self.hit_index:
+            self.hit_index.must_rebuild = True
+        if self.compiled_tree:
+            self.compiled_tree.must_rebuild = True
+
     def get_children(self)->List["Element"]:
         """Returns the children of the element, but not the children of the children and so on."""
         return self.children
@@ -1340,9 +1802,13 @@ class Element:
     def get_all_descendants(self)->List["Element"]:
         """Returns all the descendants of the elements, including self,
         i.e. its children, the children of its children and so on."""
-        d = [self]
-        for e in self.children:
-            d += e.get_all_descendants()
+        p.resolve_positions() #once for the whole tree
+        d = []
+        stack = [self]
+        while stack:
+            e = stack.pop()
+            d.append(e)
+            stack.extend(reversed(e.children))
         return d
    
     def has_descendant_in_state(self, state)->bool:
@@ -1407,10 +1873,12 @@ class Element:
         """Set the element as invisible.
         <value> : if False, the element is visible, otherwise it is invisible.
         <recursive> : if True, recursively call this on the children elements."""
+        self.mark_dirty()
         if not value:
             self.state = "normal"
         else:
             self.state = "unactive"
+        self.mark_dirty()
         if recursive:
             for e in self.get_children():
                 e.set_invisible(value, recursive)
@@ -1426,6 +1894,7 @@ class Element:
             self.state = "normal"
         for c in self.get_all_descendants():
             c.state = self.state
+            c.mark_dirty()
 
     def gray_out(self, value:bool)->None: #alias for set_locked
         self.set_locked(value)
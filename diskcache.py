@@ -0,0 +1,224 @@
+"""Persistent cache of the surfaces generated by the styles and by the shadow generators.
+The surfaces are stored on the disk as raw pixel blobs, so that the next launches of the application
+load them instead of generating them again. See thorpy.set_disk_cache.
+Each file contains a magic string, the length of a JSON header describing the surfaces and the additional
+data, then the pixels of the surfaces (as given by pygame.image.tobytes). Nothing in the files is executed."""
+import os, json, struct, hashlib
+import pygame
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import parameters as p
+
+FORMAT_VERSION = 2 #increment when the way surfaces are generated or stored changes
+MAGIC = b"THORPYDC"
+HEADER_LENGTH = struct.Struct("<I")
+
+
+class UnstableKey(Exception):
+    """_Raised when a value cannot be identified in the same way from one launch to another."""
+
+
+def get_stable_repr(value:Any)->str:
+    """_Returns a string identifying <value> in a way that does not depend on the current process
+    (memory addresses, hashing seed...). Raises UnstableKey if this is not possible."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return repr(value)
+    elif isinstance(value, (tuple, list)):
+        return "(" + ",".join([get_stable_repr(v) for v in value]) + ")"
+    elif isinstance(value, (set, frozenset)):
+        return "{" + ",".join(sorted([get_stable_repr(v) for v in value])) + "}"
+    elif isinstance(value, dict):
+        items = sorted([get_stable_repr(k) + ":" + get_stable_repr(v) for k,v in value.items()])
+        return "{" + ",".join(items) + "}"
+    elif isinstance(value, (pygame.Rect, pygame.Color)):
+        return repr(value)
+    elif isinstance(value, type):
+        return value.__module__ + "." + value.__qualname__
+    elif isinstance(value, pygame.font.Font):
+        return "Font" + get_stable_repr(get_font_identity(value))
+    elif hasattr(value, "__dict__") and not isinstance(value, pygame.Surface) and not callable(value):
+        return get_stable_repr(value.__class__) + get_stable_repr(vars(value))
+    raise UnstableKey(value)
+
+
+def get_font_identity(font:pygame.font.Font)->tuple:
+    """_Returns the arguments with which <font> was built by thorpy (including the name or path of the font)
+    and its current rendering options. Raises UnstableKey for the fonts not built by thorpy."""
+    from .styles import fonts
+    for key, value in fonts.items():
+        if value is font:
+            return key + (font.get_bold(), font.get_italic(), font.get_underline())
+    raise UnstableKey(font)
+
+
+def encode_value(value:Any)->Any:
+    """_Returns a JSON-compatible version of <value>, keeping the types that JSON does not distinguish.
+    Raises ValueError for the values that cannot be stored."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    elif isinstance(value, list):
+        return [encode_value(v) for v in value]
+    elif isinstance(value, tuple):
+        return {"tuple":[encode_value(v) for v in value]}
+    elif isinstance(value, pygame.Rect):
+        return {"Rect":list(value)}
+    elif isinstance(value, pygame.Color):
+        return {"Color":list(value)}
+    elif isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        return {"dict":{k:encode_value(v) for k,v in value.items()}}
+    raise ValueError("Cannot store value " + repr(value))
+
+def decode_value(value:Any)->Any:
+    """_Inverse of encode_value."""
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    elif isinstance(value, dict):
+        (kind, content), = value.items()
+        if kind == "tuple":
+            return tuple([decode_value(v) for v in content])
+        elif kind == "Rect":
+            return pygame.Rect(content)
+        elif kind == "Color":
+            return pygame.Color(*content)
+        elif kind == "dict":
+            return {k:decode_value(v) for k,v in content.items()}
+        raise ValueError("Unknown kind " + kind)
+    return value
+
+
+class DiskCache:
+    """Directory storing one file per generated list of surfaces. The name of each file is a hash of
+    the fingerprint of what generated the surfaces, the current theme and the version of pygame."""
+
+    def __init__(self):
+        self.path:Optional[str] = None #None means that the cache is disabled
+        self.hits:int = 0
+        self.misses:int = 0
+        self.writes:int = 0
+
+    def get_filename(self, key:Any)->Optional[str]:
+        """_Returns the file corresponding to <key>, or None if key is not stable across launches."""
+        try:
+            r = get_stable_repr((FORMAT_VERSION, pygame.version.ver, p.current_theme, key))
+        except UnstableKey:
+            return None
+        digest = hashlib.sha1(r.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, digest + ".bin") #type:ignore #guaranteed when cache is enabled
+
+    def load(self, key:Any)->Optional[Tuple[List[pygame.Surface], Dict[str,Any]]]:
+        """Returns the surfaces and the additional data stored for <key>, or None."""
+        filename = self.get_filename(key)
+        if filename is None:
+            return None
+        try:
+            with open(filename, "rb") as f:
+                blob = f.read()
+            surfaces, data = self.decode(blob)
+        except Exception: #missing, corrupted or incompatible file
+            self.misses += 1
+            return None
+        self.hits += 1
+        return surfaces, data
+
+    def save(self, key:Any, surfaces:List[pygame.Surface], data:Optional[Dict[str,Any]]=None)->None:
+        """Stores <surfaces> and <data> (made of basic types, tuples, Rects and Colors) for <key>. Fails silently,
+        as the cache is just an optimization."""
+        filename = self.get_filename(key)
+        if filename is None:
+            return
+        try:
+            blob = self.encode(surfaces, data or {})
+            os.makedirs(self.path, exist_ok=True) #type:ignore #guaranteed when cache is enabled
+            tmp = filename + "." + str(os.getpid()) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, filename) #another process may read the file at the same time
+        except Exception:
+            return
+        self.writes += 1
+
+    def encode(self, surfaces:List[pygame.Surface], data:Dict[str,Any])->bytes:
+        """_Returns the content of the file storing <surfaces> and <data>."""
+        descriptions = []
+        pixels = []
+        for s in surfaces:
+            if s.get_bitsize() < 16: #palette is not stored
+                raise ValueError("Cannot store palettized surfaces")
+            fmt = "RGBA" if s.get_masks()[3] else "RGB"
+            colorkey = s.get_colorkey()
+            descriptions.append({"size":list(s.get_size()), "format":fmt,
+                                 "flags":s.get_flags() & pygame.SRCALPHA, "bitsize":s.get_bitsize(),
+                                 "masks":list(s.get_masks()), "alpha":s.get_alpha(),
+                                 "colorkey":list(colorkey) if colorkey else None})
+            pixels.append(pygame.image.tobytes(s, fmt))
+        header = json.dumps({"version":FORMAT_VERSION, "surfaces":descriptions,
+                             "data":encode_value(data)}).encode("utf-8")
+        return b"".join([MAGIC, HEADER_LENGTH.pack(len(header)), header] + pixels)
+
+    def decode(self, blob:bytes)->Tuple[List[pygame.Surface], Dict[str,Any]]:
+        """_Returns the surfaces and the data stored in <blob> (see encode).
+        Raises ValueError if blob is not a valid file of the current version."""
+        if not blob.startswith(MAGIC):
+            raise ValueError("Not a thorpy disk cache file")
+        i = len(MAGIC)
+        header_length, = HEADER_LENGTH.unpack_from(blob, i)
+        i += HEADER_LENGTH.size
+        header = json.loads(blob[i:i+header_length].decode("utf-8"))
+        i += header_length
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError("Incompatible version")
+        surfaces = []
+        for description in header["surfaces"]:
+            size, fmt = tuple(description["size"]), description["format"]
+            n = size[0] * size[1] * len(fmt)
+            if len(blob) < i + n:
+                raise ValueError("Truncated file")
+            surfaces.append(self.build_surface(blob[i:i+n], size, fmt, description["flags"],
+                                               description["bitsize"], description["masks"],
+                                               description["colorkey"], description["alpha"]))
+            i += n
+        if i != len(blob):
+            raise ValueError("Unexpected content")
+        return surfaces, decode_value(header["data"])
+
+    def build_surface(self, raw:bytes, size:Tuple[int,int], fmt:str, flags:int, bitsize:int,
+                      masks:List[int], colorkey:Optional[List[int]], alpha:Optional[int])->pygame.Surface:
+        """_Returns the surface described by the arguments (see encode)."""
+        pixel_format = pygame.Surface((1,1), flags, bitsize, masks) #same format as the stored surface
+        s = pygame.image.frombytes(raw, size, fmt).convert(pixel_format)
+        if colorkey is not None:
+            s.set_colorkey(colorkey)
+        if alpha is not None:
+            s.set_alpha(alpha)
+        return s
+
+    def clear(self)->None:
+        """Removes the files of the cache from the disk."""
+        if self.path and os.path.isdir(self.path):
+            for fn in os.listdir(self.path):
+                if fn.endswith(".bin"):
+                    os.remove(os.path.join(self.path, fn))
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def get_stats(self)->Dict[str,Any]:
+        """Returns a dict with the number of hits, misses and writes of the cache."""
+        return {"path":self.path, "hits":self.hits, "misses":self.misses, "writes":self.writes}
+
+disk_cache = DiskCache()
+
+def set_disk_cache(path:Optional[str])->None:
+    """Set the directory where the surfaces generated by the styles and the shadows are stored,
+    so that the next launches of the application load them from the disk instead of generating them.
+    This mostly speeds up the startup of applications using large or shadowed elements.
+    <path> : (str) path of the directory, created if needed. None disables the cache (default)."""
+    disk_cache.path = path
+
+def clear_disk_cache()->None:
+    """Removes the files stored by the disk cache in its current directory."""
+    disk_cache.clear()
+
+def get_disk_cache_stats()->Dict[str,Any]:
+    """Returns a dict with the statistics of the disk cache."""
+    return disk_cache.get_stats()
@@ -17,7 +17,7 @@ import pygame
 
 from typing import Optional, List, Tuple, Sequence
 
-from . import styles, loops
+from . import styles, loops, statemanager
 from . import parameters as p
 from .graphics import darken, enlighten
 from . import graphics
@@ -43,13 +43,8 @@ cursors_resize = {(True,True):cursor_resize, (True,False):cursor_resize_x, (Fals
 #     pygame.mouse.set_cursor(cursor)
 #     p.cursor = cursor
 
-def set_cursor_resize(x,y):
-    cursor = cursors_resize.get((x,y))
-    pygame.mouse.set_cursor(cursor)
-    p.cursor = cursor
-
 def set_cursor_arrow():
-    pygame.mouse.set_cursor(cursor_arrow)
+    statemanager.manager.request_cursor(cursor_arrow)
     p.cursor = cursor_arrow
 
 
@@ -163,8 +158,10 @@ class Button(Element):
             self.set_max_text_width(max_width, refresh=False)
         else:
             self.set_max_text_width(0, refresh=False)
+        self.mark_dirty()
         self.refresh_surfaces()
         self.rect = self.get_rect() #rect is inherited from Element
+        self.mark_dirty()
         if adapt_parent and self.parent:
             self.parent.resort()
 
@@ -278,6 +275,81 @@ class OutlinedText(Text):
             self.set_style_attr("outline_thickness", outline_thickness)
 
 
+class BitmapText(Text):
+    """Single line text meant to change very often (counters, timers, scores...). The element keeps a
+    fixed size and its background is generated once. The glyphs of the font are rendered once as well,
+    so that changing the text only composes the glyphs over a copy of the background.
+    ***Mandatory arguments***
+    <text> : the initial text content.
+    ***Optional arguments***
+    <template> : text defining the size of the element, e.g. '0000' for a 4 digits counter.
+    If None, the initial text is used.
+    <charset> : characters whose glyphs are rendered in advance. Other characters are rendered when needed.
+    <font_size> : size of the font (integer).
+    <font_color> : color of the font in (R,G,B) format.
+    """
+
+    def __init__(self, text, template=None, charset="0123456789 .,:-+%/", font_size=None, font_color=None,
+                 style_normal=None, generate_surfaces=True, only_normal=True):
+        self.template = text if template is None else template
+        self.charset = charset
+        self.composed = {} #(text, background, surface) for each (state, frame)
+        super().__init__(text, font_size, font_color, style_normal, generate_surfaces, only_normal)
+
+    def generate_surfaces(self):
+        """Build the background surfaces of the element, whose size is given by the template text."""
+        text = self.text
+        self.text = "" #the text is composed on the fly
+        auto_styles = []
+        for style in self.styles.values():
+            if style and style.size == "auto":
+                w, h = style.get_line_size(self.template)
+                style.size = (w + 2*style.margins[0], h + 2*style.margins[1])
+                auto_styles.append(style)
+        super().generate_surfaces()
+        for style in auto_styles:
+            style.size = "auto"
+        self.text = text
+
+    def set_text(self, text, adapt_parent=True, only_if_different=True, max_width=None):
+        """Change the text without regenerating the surfaces of the element, whose size remains the same.
+        ***Mandatory arguments***
+        <text> : the new text.
+        ***Optional arguments***
+        <adapt_parent> and <max_width> are ignored, since the size of the element does not change.
+        <only_if_different> : set to False to redraw the element even if the text did not change.
+        """
+        if text == self.text and only_if_different:
+            return
+        self.text = text
+        self.mark_dirty()
+
+    def set_template(self, template):
+        """Change the text defining the size of the element, and regenerate its surfaces."""
+        self.template = template
+        self.generate_surfaces()
+
+    def get_frame(self, state, it):
+        background = super().get_frame(state, it)
+        composed = self.composed.get((state, it))
+        if composed and composed[0] == self.text and composed[1] is background:
+            return composed[2]
+        style = self.styles["normal" if self.has_copied_normal_state() else state]
+        atlas = styles.get_glyph_atlas(style.font, style.font_antialias, style.font_color, self.charset)
+        surface = background.copy()
+        r_text = pygame.Rect((0,0), atlas.get_size(self.text))
+        r_text.centery = surface.get_height()//2
+        if style.font_align == "l":
+            r_text.x = style.margins[0]
+        elif style.font_align == "r":
+            r_text.right = surface.get_width() - style.margins[0]
+        else:
+            r_text.centerx = surface.get_width()//2
+        atlas.blit(surface, self.text, r_text.topleft)
+        self.composed[(state, it)] = (self.text, background, surface)
+        return surface
+
+
 
 class Box(Element):
     """Graphical box that contains children elements.
@@ -347,9 +419,7 @@ class Box(Element):
             self.add_child(self.resizer)
             self.resizer.draw = self.resizer.do_nothing
             # self.resizer.set_bck_color((127,)*4)
-            self.resizer.at_hover = set_cursor_resize
-            self.resizer.at_hover_params = {"x":x, "y":y}
-            self.resizer.at_unhover = set_cursor_arrow
+            self.resizer.hover_cursor = cursors_resize[(x,y)]
             self.refresh_resizer_size()
         else:
             if self.resizer:
@@ -836,6 +906,8 @@ class TextInput(Button):
     ***Optional arguments***
     <placeholder> : text of the placeholder (empty by default).
     """
+    hover_cursor = cursor_ibeam
+
     def __init__(self, text, placeholder="", style_normal=None, style_hover=None,
                     style_pressed=None, generate_surfaces=True, placeholder_color=None):
         self.focused = False
@@ -919,6 +991,9 @@ class TextInput(Button):
         dragged = Button.update(self, mouse_delta)
         if self.it % self.cursor_blinking_mod == 0:
             self.showing_cursor = not(self.showing_cursor)
+        if self.focused: #value or cursor may have changed
+            p.animating = True
+            self.mark_dirty()
         return dragged
 
     def can_add(self): #TODO: use size !
@@ -926,9 +1001,9 @@ class TextInput(Button):
         if self.placeholder and not(self.value):
             if self.placeholder_color is None:
                 self.placeholder_color = TextInput.style_locked.font_color
-            text = style.font.render(self.placeholder, True, self.placeholder_color)
+            text = styles.render_text(style.font, self.placeholder, True, self.placeholder_color)
         else:
-            text = style.font.render(self.value, True, style.font_color)
+            text = styles.render_text(style.font, self.value, True, style.font_color)
         current_width = self.surfaces[self.state][0].get_width()
         if text.get_width() >= current_width - self.input_margin_x - self.cursor_width:
             if self.focused and self.stop_if_too_large:
@@ -1026,7 +1101,7 @@ class TextInput(Button):
 
     def focus(self):
         if self.focused: #then set the cursor to the mouse pos
-            pos = pygame.mouse.get_pos()
+            pos = p.get_inputs().pos
             r = self.get_rect()
             dx = pos[0] - (r.x + self.input_margin_x)
             style = self.get_current_style()
@@ -1047,14 +1122,6 @@ class TextInput(Button):
                                         reaction=self.reaction_keyboard)
             self.focused = False
 
-    def default_at_hover(self):
-        Button.default_at_hover(self)
-        pygame.mouse.set_cursor(cursor_ibeam)
-
-    def default_at_unhover(self):
-        Button.default_at_hover(self)
-        pygame.mouse.set_cursor(cursor_arrow)
-
     def direct_launch(self, element=None):
         """Launch the text input to the screen without asking the user to press a button,
         and directly put the focus on it.
@@ -1089,6 +1156,8 @@ class DropDownListButton(Button):
     <size_limit> : 2-tuple of integers to define the maximum size of the box in which choices are displayed.
     <generate_shadow> : 2-tuple whose first value is a boolean stating whether a shadow should be generated for the list,
     and whose second value is either 'auto' or a boolean stating whether the shadow generation should be done in fast mode.
+    Set the attribute freeze_background to True to draw the locked elements from a snapshot while the list is shown
+    in blocking mode (see Element.launch_and_lock_others).
     """
 
     def __init__(self, choices, title=None, style_normal=None, generate_surfaces=True,
@@ -1106,6 +1175,7 @@ class DropDownListButton(Button):
         self.ddl = DropDownList(self, choices, choice_mode, bck_func, overwrite_choices,
                                 size_limit, generate_shadow, align, gap, all_same_width)
         self.launch_nonblocking = launch_nonblocking
+        self.freeze_background = False #if True, the locked elements are drawn from a snapshot while the list is shown
         self.action = self.default_at_unclick
 
 ##        faire txt a cote
@@ -1119,7 +1189,8 @@ class DropDownListButton(Button):
             self.ddl.launch_nonblocking(click_outside_cancel=self.click_outside_cancel)
         else:
             self.ddl.launch_and_lock_others(self.parent_to_lock, func_before=self.bck_func,
-                                            click_outside_cancel=self.click_outside_cancel)
+                                            click_outside_cancel=self.click_outside_cancel,
+                                            freeze_others=self.freeze_background)
             if self.at_unclick:
                 self.at_unclick()
         
@@ -1378,6 +1449,7 @@ class Helper(Element):
         return self.time_before_launch <= 0
 
     def update(self,  mouse_delta):
+        was_drawn = self.must_draw()
         dragged = Element.update(self,  mouse_delta)
         # if self.event_parent.state == "hover" or self.event_parent.state == "pressed" or self.event_parent.being_dragged:
         if mouse_delta[0] != 0 or mouse_delta[1] != 0:
@@ -1385,15 +1457,19 @@ class Helper(Element):
         if self.event_parent.state == "hover" or self.event_parent.state == "pressed" or self.event_parent.being_dragged:
             self.time_before_launch -= 1
             self.last_parent_state_was_hover = True
+            if self.time_before_launch >= 0: #countdown in progress
+                p.animating = True
         elif self.last_parent_state_was_hover: #parent is not hovered now, but it was before!
             self.reset_countdown_and_anchor()
         #
 
         if self.time_before_launch <= 0:
             if not self.anchor or self.follow_mouse:
-                self.anchor = pygame.mouse.get_pos()
+                self.anchor = p.get_inputs().pos
             self.set_center(*self.anchor)
             self.move(*self.offset)
+        if was_drawn != self.must_draw():
+            self.mark_dirty()
         return dragged
     
     def reset_countdown_and_anchor(self):
@@ -1499,7 +1575,7 @@ class ColorPicker(Element):
 
     def click_bar(self):
         if self.colorbar.set_when_click:
-            pos = pygame.mouse.get_pos()
+            pos = p.get_inputs().pos
             if not self.colorbar.dragger.rect.collidepoint(pos):
                 self.colorbar.dragger.set_topleft(*pos)
                 self.colorbar.control_dragger_pos()
@@ -1530,7 +1606,7 @@ class ColorPicker(Element):
 
     def click_frame(self, xy=None):
         if xy is None:
-            xy = pygame.mouse.get_pos()
+            xy = p.get_inputs().pos
         rect = self.colorframe.rect.inflate((-2,-2))
         if rect.collidepoint(xy):
             x = xy[0] - self.colorframe.rect.x
@@ -1647,7 +1723,7 @@ class ColorPickerRGB(Element):
 
     def click_bar(self, slider):
         if slider.set_when_click:
-            pos = pygame.mouse.get_pos()
+            pos = p.get_inputs().pos
             if not slider.dragger.rect.collidepoint(pos):
                 slider.dragger.set_topleft(*pos)
                 slider.control_dragger_pos()
@@ -2137,6 +2213,8 @@ class ToggleButton(Button):
 
     def generate_surfaces(self)->None:
         super().generate_surfaces()
+        if self in p.batch_generation: #deferred to the end of the batch
+            return
         style = self.styles["pressed"].copy()
         style.font_color = self.styles["normal"].font_color
         # style.shadowgen = None
@@ -2146,6 +2224,7 @@ class ToggleButton(Button):
     def toggle(self):
         """Use this method to toggle the state (normal to pressed or pressed to normal)"""
         self.value = not self.value
+        self.mark_dirty()
 
     def default_at_unclick(self): #toggle delegated to click if pressed
         self.toggle()
@@ -2174,6 +2253,7 @@ class ToggleButton(Button):
     
     def set_value(self, value):
         self.value = value
+        self.mark_dirty()
 
     
 class Checkbox(ToggleButton):
@@ -2197,8 +2277,10 @@ class Checkbox(ToggleButton):
 
     def generate_surfaces(self):
         Button.generate_surfaces(self)
+        if self in p.batch_generation: #deferred to the end of the batch
+            return
         #1. Resize check sign ###############################################
-        from thorpy import fn
+        from . import fn
         self.check_sign = pygame.image.load(fn("data/check.png"))
         r = self.check_sign.get_rect()
         if r.w > 2*self.check_sign.get_width():
@@ -2210,6 +2292,7 @@ class Checkbox(ToggleButton):
         color_check_sign = self.get_style("pressed").font_color
         graphics.change_color_on_img_ip(self.check_sign, (51,)*3, color_check_sign)
         r = self.check_sign.get_rect()
+        self.surfaces["pressed"] = [s.copy() for s in self.surfaces["pressed"]] #may be shared with other elements
         for s in self.surfaces["pressed"]:
             r.center = self.rect.center
             r.x -= self.rect.x
@@ -2247,7 +2330,10 @@ class Radio(Checkbox):
 
     def generate_surfaces(self):
         Button.generate_surfaces(self)
+        if self in p.batch_generation: #deferred to the end of the batch
+            return
         r = self.surfaces["pressed"][0].get_rect()
+        self.surfaces["pressed"] = [s.copy() for s in self.surfaces["pressed"]] #may be shared with other elements
         for s in self.surfaces["pressed"]:
             r.center = self.rect.center
             r.x -= self.rect.x
@@ -2410,6 +2496,7 @@ class SingleStateImage(Image):
     def set_image(self, img:pygame.Surface) -> None:
         self.img = img
         self.surfaces["normal"] = self.styles["normal"].generate_images(self.img)
+        self.mark_dirty()
 
     def get_image(self) -> pygame.Surface:
         return self.img
@@ -2502,8 +2589,10 @@ class AnimatedGif(Image):
     def update_iframe(self):
         style = self.get_current_style()
         if self.loops > 0 and style and style.frame_mod > 0:
+            p.animating = True
             if self.it % style.frame_mod == 0:
                 self.i_frame += 1
+                self.mark_dirty()
             if self.i_frame == style.nframes:
                 self.i_frame = 0
                 self.loops -= 1
@@ -2518,8 +2607,9 @@ class AnimatedGif(Image):
         """_Update state of the element. Return True if element was dragged."""
         if self.state == "locked":
             return False
-        mouse_pos = pygame.mouse.get_pos()
-        mouse_pressed = pygame.mouse.get_pressed()
+        inputs = p.get_inputs()
+        mouse_pos = inputs.pos
+        mouse_pressed = inputs.buttons
         dragged = False #self has been dragged ?
 ##        self.being_dragged = False
         children_dragged = False
@@ -2528,8 +2618,9 @@ class AnimatedGif(Image):
         #Caution : self.state may be changed by children
         really_active = self.state != "unactive" and self.state != "locked"
         if not really_active:
-            self.it += 1
+            self.it += p.steps
         else:
+            old_rect, old_state = self.rect, self.state
             self.rect = self.get_rect()
             if self.rect.collidepoint(mouse_pos):
                 if mouse_pressed[0]: #left click
@@ -2542,6 +2633,7 @@ class AnimatedGif(Image):
                                 pygame.display.update(self.rect)
                                 self._at_click(**self._at_click_params)
                             self.default_at_click()
+                            statemanager.manager.push_transition("click", self)
                         if not children_dragged:
                             if self.draggable_x or self.draggable_y:
                                 p.element_being_dragged = self
@@ -2556,6 +2648,7 @@ class AnimatedGif(Image):
                         if self.at_unclick:
                             self.at_unclick(**self.at_unclick_params)
                         self.default_at_unclick()
+                        statemanager.manager.push_transition("unclick", self)
                     elif self.state != "hover":
                         # self.i_frame = 0
                         self.state = "hover"
@@ -2564,6 +2657,7 @@ class AnimatedGif(Image):
                         if self.at_hover:
                             self.at_hover(**self.at_hover_params)
                         self.default_at_hover()
+                        statemanager.manager.push_transition("hover", self)
             else: #mouse do not collide with element
                 if self.being_dragged:
                     dragged = False
@@ -2577,19 +2671,21 @@ class AnimatedGif(Image):
                     if self.state == "hover":
                         # self.i_frame = 0
                         self.state = "normal"
-                        if self.hand_cursor:
-                            pygame.mouse.set_cursor(cursor_arrow)
                         if self.at_unhover:
                             self.at_unhover(**self.at_unhover_params)
                         self.default_at_unhover()
+                        statemanager.manager.push_transition("unhover", self)
                         self.being_dragged = False
                     if self.state != "normal":
                         # self.i_frame = 0
                         self.state = "normal"
-            self.it += 1
-            self.update_iframe()
-        if self.state == "hover" and self.hand_cursor:
-            pygame.mouse.set_cursor(cursor_hand)
+            if self.state != old_state:
+                if p.dirty_rects is not None:
+                    p.dirty_rects.append(self.get_damaged_rect(old_rect))
+                self.mark_dirty()
+            self.advance_animation()
+        if self.state == "hover" or self.being_dragged:
+            self.request_cursor()
         return dragged
         
 
@@ -2612,12 +2708,12 @@ class ArrowButton(Button):
     def refresh_surfaces_build(self):
         for key, style in self.styles.items():
             if style:
-                self.surfaces[key] = style.generate_images(self.text, self.orientation)
+                self.surfaces[key] = style.get_images(self.text, self.orientation)
         self.has_surfaces_generated = True
         self.refresh_surfaces_shadow()
 
     def refresh_surfaces_copy(self):
-        s = self.styles["normal"].generate_images(self.text, self.orientation)
+        s = self.styles["normal"].get_images(self.text, self.orientation)
         for key in self.styles.keys():
             self.surfaces[key] = s
         self.has_surfaces_generated = True
@@ -2800,7 +2896,7 @@ class Slider(Element):
 
     def bar_click(self):
         if self.set_when_click:
-            pos = pygame.mouse.get_pos()
+            pos = p.get_inputs().pos
             if not self.dragger.rect.collidepoint(pos):
                 self.dragger.set_topleft(*pos)
                 self.control_dragger_pos()
@@ -3234,6 +3330,7 @@ class WaitingBar(Lifebar):
         
 
     def update(self, mouse_delta):
+        p.animating = True
         if self.e_rect.rect.left >= self.e_frame.rect.right:
             self.e_rect.set_topright(self.e_frame.rect.left, None)
         else:
@@ -3494,18 +3591,18 @@ class Sketch(TitleBox):
             self.apply_bucket((neigh_x, neigh_y), color, original_color, already_done)
 
     def update(self, mouse_delta) -> bool:
-        mouse_buttons = pygame.mouse.get_pressed()
+        mouse_buttons = p.get_inputs().buttons
         left_button = mouse_buttons[0]
         right_button = mouse_buttons[2]
         if left_button and self.e_bucket.get_value():
-            pos = pygame.mouse.get_pos()
+            pos = p.get_inputs().pos
             if not self.e_img.rect.collidepoint(pos):
                 return super().update(mouse_delta)
             rel_pos = self.get_rel_pos(pos)
             color = self.colorpicker.get_value()
             self.apply_bucket(rel_pos, color, self.cells.get_at(rel_pos), [])
         elif left_button or right_button:
-            pos = pygame.mouse.get_pos()
+            pos = p.get_inputs().pos
             if not self.e_img.rect.collidepoint(pos):
                 return super().update(mouse_delta)
             rel_pos = self.get_rel_pos(pos)
@@ -3572,7 +3669,7 @@ class Sketch(TitleBox):
         cursor_size = self.e_cursor_size.get_value()
         if self.e_bucket.get_value():
             cursor_size = 1
-        x,y = pygame.mouse.get_pos()
+        x,y = p.get_inputs().pos
         rp = self.get_rel_pos((x,y))
         x = rp[0] * self.cells_size[0]
         y = rp[1] * self.cells_size[1]
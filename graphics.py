@@ -1,12 +1,17 @@
 """
 Module regrouping some functions for image processing.
-Some of the functions make use of Python Imaging Library and NumPy.
+Some of the functions make use of NumPy, and a few ones (conversions to PIL images) of Python Imaging Library.
 """
-from typing import Sequence, cast, Any, Dict
+from typing import Sequence, List, Optional, cast, Any, Dict
+from collections import OrderedDict
 import math
 import numpy as np
-from PIL import Image, ImageFilter
-PILimage = Image.Image
+try:
+    from PIL import Image, ImageFilter
+    PILimage = Image.Image
+except ImportError: #PIL is optional, shadows and blurs only need NumPy
+    Image = ImageFilter = None
+    PILimage = Any
 
 from .thorpytypehints import *
 
@@ -301,95 +306,154 @@ def get_black_white(surf:pygame.Surface, black:int=128,
         bw = bw.convert(color_format)
     return pil_img_to_pygame_surf(bw, color_format)
 
+def get_gaussian_box_radius(radius:float, passes:int=3)->float:
+    """_Returns the radius of the box blur that approximates a gaussian blur of standard deviation <radius>
+    when it is applied <passes> times. Computed in single precision, exactly as PIL does."""
+    f = np.float32
+    radius = f(radius)
+    sigma2 = radius*radius/f(passes)
+    L = f(math.sqrt(12.0*float(sigma2) + 1.0))
+    l = f(math.floor((float(L) - 1.0)/2.0))
+    a = (f(2)*l + f(1))*(l*(l + f(1)) - f(3)*sigma2)
+    a /= f(6)*(sigma2 - (l + f(1))*(l + f(1)))
+    return l + a
+
+def box_blur(array:np.ndarray, radius:float, axis:int)->np.ndarray:
+    """_Returns <array> (uint8) blurred along <axis> by a box of fractional <radius>. The pixels beyond
+    the borders take the value of the border pixels. Uses the same fixed point arithmetic as PIL."""
+    r = int(radius)
+    ww = int(np.float32(1 << 24)/(radius*np.float32(2) + np.float32(1)))
+    fw = ((1 << 24) - (r*2 + 1)*ww)//2
+    a = np.moveaxis(array, axis, 0)
+    n = a.shape[0]
+    padded = np.concatenate([np.repeat(a[:1], r+1, axis=0), a, np.repeat(a[-1:], r+1, axis=0)]).astype(np.int64)
+    cumulated = np.zeros((padded.shape[0]+1,) + padded.shape[1:], np.int64)
+    np.cumsum(padded, axis=0, out=cumulated[1:])
+    window = cumulated[2*r+2:2*r+2+n] - cumulated[1:1+n] #sum of the 2r+1 pixels around each pixel
+    far = padded[0:n] + padded[2*r+2:2*r+2+n] #pixels partially covered by the box
+    blurred = (window*ww + far*fw + (1 << 23)) >> 24
+    return np.moveaxis(blurred.astype(np.uint8), 0, axis)
+
+def blur_array(array:np.ndarray, radius:float, axes:Sequence[int]=(0,1), passes:int=3)->np.ndarray:
+    """Returns a blurred copy of <array> (uint8, with channels as last axis if any). The gaussian blur is
+    approximated by <passes> box blurs along each of the <axes> (the horizontal one first),
+    which gives the same results as PIL's GaussianBlur.
+    ***Mandatory arguments***
+    <array> : numpy array of the pixels, e.g. as returned by pygame.surfarray.array3d.
+    <radius> : standard deviation of the blur.
+    ***Optional arguments***
+    <axes> : the axes to blur, in the order of the blurs. (0,1) for arrays indexed by [x,y].
+    <passes> : number of box blurs along each axis."""
+    if radius == 0 or array.size == 0:
+        return array.copy()
+    box_radius = get_gaussian_box_radius(radius, passes)
+    for axis in axes:
+        for i in range(passes):
+            array = box_blur(array, box_radius, axis)
+    return array
+
 def get_blurred(surf:pygame.Surface, radius:int=2,
                 color_format:PygCol2="RGBA")->pygame.Surface:
-    """Returns a blurred version of the image, using PIL.
+    """Returns a blurred version of the image.
     ***Mandatory arguments***
     <surf> : the image you want to blur (pygame.Surface).
     ***Optional arguments***
     <radius> : radius of the blurry zone.
-    <color_format> : an accepted color format by PIL."""
-    img = pygame_surf_to_pil_img(surf, color_format)
-    img = img.filter(ImageFilter.GaussianBlur(radius))
-    surface = pil_img_to_pygame_surf(img, color_format)
-    return surface
+    <color_format> : format of the pixels of the blurred image, e.g. 'RGB' or 'RGBA'."""
+    w, h = surf.get_size()
+    array = np.frombuffer(tostring(surf, color_format, False), np.uint8).reshape((h, w, -1))
+    array = blur_array(array, radius, axes=(1,0))
+    return fromstring(array.tobytes(), (w, h), color_format)
 
 def get_shadow(surf:pygame.Surface, radius:int=2, black:int=255,
                color_format:PygCol2="RGBA", alpha_factor:int=255,
                decay_mode:str="exponential", color:RGB_OR_RGBA=(0,0,0))->pygame.Surface:
     """_prefer the Shadow class if possible
-    <black> : gray value below which the pixel is considered as opaque."""
-    img = get_black_white_pil(surf, black, color_format)
-    img = img.filter(ImageFilter.GaussianBlur(radius))
-    surface = pil_img_to_pygame_surf(img, color_format)
-    surface = set_alpha_from_intensity(surface, alpha_factor, decay_mode, color)
-    return surface
+    <black> : gray value below which the pixel is considered as opaque.
+    <color_format> is not used anymore."""
+    if surf.get_bitsize() in (24, 32):
+        rgb = surfarray.pixels3d(surf)
+    else:
+        rgb = surfarray.array3d(surf)
+    r, g, b = [rgb[:,:,i].astype(np.uint32) for i in range(3)]
+    del rgb #unlocks surf
+    gray = (r*19595 + g*38470 + b*7471 + 0x8000) >> 16 #same luma as PIL
+    bw = np.where(gray < black, 0, 255).astype(np.uint8)
+    intensity = blur_array(bw, radius).astype(np.float64)
+    #same operations as square_color_norm for a gray pixel
+    light = np.power(np.sqrt(3*np.square(intensity)), 2)
+    shadow = Surface(surf.get_size(), SRCALPHA, depth=32).convert_alpha()
+    shadow.fill(tuple(color)[0:3] + (0,))
+    arraya = surfarray.pixels_alpha(shadow)
+    arraya[:] = get_alpha_from_light(light, alpha_factor, decay_mode)
+    del arraya #unlocks shadow
+    return shadow
+
+def get_alpha_from_light(light:np.ndarray, alpha_factor:float, decay_mode:str)->np.ndarray:
+    """_Returns the alpha values of a shadow whose intensity is given by <light> (squared norms of the colors)."""
+    tuning_factor = 1.03
+    alpha = light / MAX_NORM * 255
+    if decay_mode == "linear":
+        actual_alpha = np.trunc(255 - alpha)
+    else:
+        actual_alpha = np.trunc(255 * np.power(tuning_factor, -alpha))
+    return np.trunc(alpha_factor * actual_alpha)
 
 def set_alpha_from_intensity(surface:pygame.Surface, alpha_factor:float,
                              decay_mode:str, color:RGB_OR_RGBA)->pygame.Surface:
+    """_Returns a copy of <surface> filled with <color>, whose alpha decreases with the intensity of
+    the pixels of <surface>, either linearly or exponentially according to <decay_mode>."""
     rect = surface.get_rect()
     newsurf = Surface(rect.size, SRCALPHA, depth=surface.get_bitsize())
     newsurf = newsurf.convert_alpha()
     newsurf.blit(surface, (0, 0))
     arrayrgb = surfarray.pixels3d(newsurf)
     arraya = surfarray.pixels_alpha(newsurf)
-    bulk_color = tuple(color)
-    tuning_factor = 1.03
-    is_linear = decay_mode == "linear"
-    for x in range(rect.left, rect.right):
-        for y in range(rect.top, rect.bottom):
-            color = tuple(arrayrgb[x][y]) #type:ignore
-            light = square_color_norm(color)
-            alpha = float(light)/MAX_NORM * 255
-            arrayrgb[x][y][0] = bulk_color[0]
-            arrayrgb[x][y][1] = bulk_color[1]
-            arrayrgb[x][y][2] = bulk_color[2]
-            if is_linear:
-                actual_alpha = int(255 - alpha)
-            else:
-                actual_alpha = int(255*tuning_factor**-alpha)
-##            elif decay_mode == "quadratic":
-##                pass
-##            else:
-##                raise Exception("decay_mode not recognized: " + decay_mode)
-            # actual_alpha *= alpha_factor
-            actual_alpha = int(alpha_factor * actual_alpha)
-            arraya[x][y] = actual_alpha
+    #same operations as square_color_norm, for all pixels at once
+    light = np.power(np.sqrt(np.sum(np.square(arrayrgb, dtype=np.float64), axis=2)), 2)
+    arraya[:] = get_alpha_from_light(light, alpha_factor, decay_mode)
+    arrayrgb[:] = tuple(color)[0:3]
+    del arrayrgb, arraya #unlocks newsurf
     return newsurf
 
 
+def get_mask_frame(mask:np.ndarray)->pygame.Rect:
+    """_Returns a Rect of the minimum size to contain the True values of <mask> (indexed by [x,y]).
+    The Rect is empty if there is no True value."""
+    xs = np.flatnonzero(np.any(mask, axis=1))
+    if not len(xs):
+        return pygame.Rect(0, 0, 0, 0)
+    ys = np.flatnonzero(np.any(mask, axis=0))
+    return pygame.Rect(int(xs[0]), int(ys[0]), int(xs[-1] - xs[0]) + 1, int(ys[-1] - ys[0]) + 1)
+
 def detect_frame(surf:pygame.Surface, vacuum:RGB_OR_RGBA=(255, 255, 255))->pygame.Rect:
-    """_Returns a Rect of the minimum size to contain all that is not vacuum."""
-    vacuum = np.array(vacuum) #type:ignore
-    array = pygame.surfarray.array3d(surf)
-    x_found = False
-    last_x = 0
-    miny = float("inf") #previously : 1000000000
-    maxy = 0
-    len_x = len(array)
-    len_y = len(array[0])
-    for x in range(len_x):
-        if x % 100 == 0:
-            print("scanning pixel line " + str(x))
-        for y in range(len_y):
-            if (array[x][y] != vacuum).any():
-                if not x_found:
-                    x_found = True
-                    first_x = x
-                last_x = x
-                if y < miny:
-                    miny = y
-                if y > maxy:
-                    maxy = y
-    return pygame.Rect(first_x, miny, last_x - first_x, maxy - miny)
+    """_Returns a Rect of the minimum size to contain all that is not vacuum (alpha is ignored).
+    The Rect is empty if the whole surface is vacuum."""
+    if surf.get_bitsize() in (24, 32):
+        array = surfarray.pixels3d(surf) #no copy
+    else:
+        array = surfarray.array3d(surf)
+    mask = np.any(array != tuple(vacuum)[0:3], axis=2)
+    del array #unlocks surf
+    return get_mask_frame(mask)
+
+def detect_frame_alpha(surf:pygame.Surface, min_alpha:int=1)->pygame.Rect:
+    """_Returns a Rect of the minimum size to contain all the pixels of <surf> (which must have
+    per-pixel alpha) whose alpha is at least <min_alpha>. The Rect is empty if there is none."""
+    array = surfarray.pixels_alpha(surf) #no copy
+    mask = array >= min_alpha
+    del array #unlocks surf
+    return get_mask_frame(mask)
 
 
 def capture_screen(surface:pygame.Surface, rect:pygame.Rect|None=None)->pygame.Surface:
     """_Returns a copy of the surface <surface>, with restriction <rect>
-    (None means the whole surface)"""
+    (None means the whole surface). <rect> is clipped to the surface."""
     if not rect:
         rect = surface.get_rect()
-    return surface.copy().subsurface(rect).convert()
+    else:
+        rect = rect.clip(surface.get_rect())
+    return surface.subsurface(rect).convert() #convert returns a new surface
 
 
 def draw_gradient_along_path(surface:pygame.Surface, path:Sequence[Coord],
@@ -728,16 +792,10 @@ def smoothed_circle(radius:int)->pygame.Surface:
     pygame.draw.circle(circle, (0,0,0), (radius,radius), radius)
     return circle
 
-@cache
-def smoothed_round_rect(n_smooth:int, color:RGB_OR_RGBA,
-                        size:Size, radius:float|int, force_radius:bool)->pygame.Surface:
-    orig_size = size
-    size = (size[0]*n_smooth, size[1]*n_smooth)
-    if radius == 0:
-        return color_rect(color, size)
-    rect = pygame.Rect((0, 0), size)
-    s = Surface(rect.size, pygame.SRCALPHA)
-    square_side = min(rect.size)
+def get_round_rect_radius(size:Size, radius:float|int, force_radius:bool, n_smooth:float)->int|float:
+    """_Returns the radius of the corners of a round rect of size <size> (see round_rect_aa),
+    in the pixels of the surface supersampled <n_smooth> times."""
+    square_side = min(pygame.Rect((0, 0), (size[0]*n_smooth, size[1]*n_smooth)).size)
     if radius < 1:
         radius = int(radius * square_side)
         if radius > square_side // 2 - 2:
@@ -749,6 +807,23 @@ def smoothed_round_rect(n_smooth:int, color:RGB_OR_RGBA,
     #
     if radius < 0:
         radius = 0
+    return radius
+
+def smoothed_round_rect(n_smooth:int, color:RGB_OR_RGBA,
+                        size:Size, radius:float|int, force_radius:bool)->pygame.Surface:
+    if radius == 0:
+        return color_rect(color, (size[0]*n_smooth, size[1]*n_smooth))
+    radius = get_round_rect_radius(size, radius, force_radius, n_smooth)
+    return render_round_rect(n_smooth, color, size, radius)
+
+def render_round_rect(n_smooth:float, color:RGB_OR_RGBA,
+                      size:Size, radius:float|int)->pygame.Surface:
+    """_Returns a round rect of size <size>, whose corners have radius <radius> in the pixels
+    of the surface supersampled <n_smooth> times (see get_round_rect_radius)."""
+    orig_size = size
+    size = (size[0]*n_smooth, size[1]*n_smooth)
+    rect = pygame.Rect((0, 0), size)
+    s = Surface(rect.size, pygame.SRCALPHA)
     diameter = 2*radius
     #a circle is drawn on each corner of the rect
     circle = smoothed_circle(radius) #type:ignore #we are sure here that radius is an int
@@ -777,7 +852,72 @@ def smoothed_round_rect(n_smooth:int, color:RGB_OR_RGBA,
     return pygame.transform.smoothscale(s, orig_size)
 
 
-# @cache
+round_rect_templates = OrderedDict() #LRU cache of the 9-slice templates, for each (n_smooth, color, radius)
+MAX_CACHED_ROUND_RECTS = 200
+
+def is_supersampling_exact(size:Size, n_smooth:float)->bool:
+    """_Returns True if the sides of <size> supersampled <n_smooth> times are integers."""
+    return all([x*n_smooth == int(x*n_smooth) for x in size])
+
+def get_round_rect_template(n_smooth:float, color:RGB_OR_RGBA,
+                            radius:float|int)->tuple[Optional[pygame.Surface],int]:
+    """_Returns a small round rect whose corners have radius <radius> (see get_round_rect_radius),
+    and the size of its corners in pixels. The line and the column between the corners are uniform,
+    so that the template can be stretched by nine_slice to any size whose supersampling is exact
+    (see is_supersampling_exact) : the result is then the same as a round rect rendered at that size.
+    The template is None if no such template exists for these parameters. Templates are cached."""
+    key = (n_smooth, color, radius)
+    template = round_rect_templates.get(key)
+    if template:
+        round_rect_templates.move_to_end(key)
+        return template
+    corner = int(math.ceil(radius / n_smooth)) + 2 #margin for the smoothing
+    #the smoothing repeats every <period> pixels : the edges of the template span a whole period
+    period = 1
+    while not is_supersampling_exact((period,), n_smooth) and period < 16:
+        period += 1
+    side = (2*corner + 2*period - 1) // period * period
+    surface = None
+    if is_supersampling_exact((period,), n_smooth):
+        s = render_round_rect(n_smooth, color, (side,side), radius)
+        surface = pygame.Surface((side,side), flags=pygame.SRCALPHA).convert_alpha()
+        surface.blit(s, (0,0))
+        colors = get_rgba_array(surface)
+        columns, lines = colors[corner:side-corner], colors[:,corner:side-corner] #between the corners
+        if not((columns == columns[:1]).all() and (lines == lines[:,:1]).all()):
+            surface = None #the smoothing does not give uniform edges, e.g. with n_smooth=1.25
+    template = round_rect_templates[key] = (surface, corner)
+    if len(round_rect_templates) > MAX_CACHED_ROUND_RECTS:
+        round_rect_templates.popitem(last=False)
+    return template
+
+def nine_slice(template:pygame.Surface, size:Size, corner:int)->pygame.Surface:
+    """Returns a new surface of size <size> built from <template> : the four corners of <template>
+    (squares of side <corner>) are copied as is, while its edges are stretched.
+    The center of <template> must be uniform, and <size> must be at least as big as the corners."""
+    w, h = size
+    tw, th = template.get_size()
+    surface = pygame.Surface(size, flags=pygame.SRCALPHA).convert_alpha()
+    #(position, size) in template and in surface, for each column and each line of the slices
+    columns = ((0, corner, 0, corner), (corner, tw-2*corner, corner, w-2*corner),
+               (tw-corner, corner, w-corner, corner))
+    lines = ((0, corner, 0, corner), (corner, th-2*corner, corner, h-2*corner),
+             (th-corner, corner, h-corner, corner))
+    for sx, sw, x, dw in columns:
+        for sy, sh, y, dh in lines:
+            if dw <= 0 or dh <= 0 or sw <= 0 or sh <= 0:
+                continue
+            if sx == corner and sy == corner: #uniform center
+                surface.fill(template.get_at((sx, sy)), (x, y, dw, dh))
+                continue
+            piece = template.subsurface((sx, sy, sw, sh))
+            if (sw, sh) != (dw, dh):
+                piece = pygame.transform.scale(piece, (dw, dh))
+            #surface is transparent black : max blending copies the pixels without alpha blending
+            surface.blit(piece, (x, y), special_flags=pygame.BLEND_RGBA_MAX)
+    return surface
+
+
 def round_rect_aa(color:RGB_OR_RGBA, size:Size, radius:float|int,
                   force_radius:bool=False, n_smooth:float=1.5)->pygame.Surface:
     """Returns a round rectangle.
@@ -811,50 +951,117 @@ def round_rect_aa(color:RGB_OR_RGBA, size:Size, radius:float|int,
             color = (255,255,255,all_colors[0][-1])  #type:ignore #pygame does the cast
         else:
             color = (255,255,255)
-    s = smoothed_round_rect(n_smooth, color, size, radius, force_radius)
-    surface = pygame.Surface(size, flags=pygame.SRCALPHA).convert_alpha()
-    surface.blit(s, (0,0))
+    radius = get_round_rect_radius(size, radius, force_radius, n_smooth)
+    template, corner = get_round_rect_template(n_smooth, color, radius)
+    if template and min(size) > 2*corner and is_supersampling_exact(size, n_smooth):
+        surface = nine_slice(template, size, corner)
+    else: #too small to be sliced, or the smoothing of the corners depends on the size
+        s = render_round_rect(n_smooth, color, size, radius)
+        surface = pygame.Surface(size, flags=pygame.SRCALPHA).convert_alpha()
+        surface.blit(s, (0,0))
     if orientation:
-        scolor = color_gradient(all_colors, s.get_size(), orientation)
+        scolor = color_gradient(all_colors, surface.get_size(), orientation)
         surface.blit(scolor, (0,0), special_flags=pygame.BLEND_RGBA_MIN)
     return surface
 
 
+def get_rgba_array(surface:pygame.Surface)->np.ndarray:
+    """_Returns a (w,h,4) array of the colors of the pixels of <surface>, as given by surface.get_at."""
+    w,h = surface.get_size()
+    array = np.empty((w,h,4), np.uint8)
+    array[:,:,0:3] = surfarray.array3d(surface)
+    if surface.get_flags() & SRCALPHA:
+        array[:,:,3] = surfarray.array_alpha(surface)
+    else:
+        array[:,:,3] = 255
+    return array
+
+def get_premultiplied(surface:pygame.Surface)->pygame.Surface:
+    """_Returns a copy of <surface> with per-pixel alpha, whose colors are premultiplied by their alpha,
+    taking into account the per-surface alpha and the colorkey of <surface>. The copy is meant to be
+    blitted with the pygame.BLEND_PREMULTIPLIED flag."""
+    alpha = surface.get_alpha()
+    #convert_alpha adds the alpha channel if needed, turns the colorkey into transparent pixels and gives rows
+    #without padding, as the surfaces rendered by fonts may have (which Surface.premul_alpha does not handle)
+    premultiplied = surface.convert_alpha().premul_alpha()
+    premultiplied.set_alpha(255) #the per-surface alpha is applied to the pixels below
+    if alpha is not None and alpha < 255:
+        premultiplied.fill((alpha,)*4, special_flags=pygame.BLEND_RGBA_MULT)
+    return premultiplied
+
+def get_different_mask(colors:np.ndarray, color:RGB_OR_RGBA)->np.ndarray:
+    """_Returns a (w,h) boolean array telling which pixels of <colors> (see get_rgba_array) differ from <color>.
+    Colors are compared the same way as pygame.Color objects (alpha is 255 if not given)."""
+    packed = np.array(tuple(pygame.Color(color)), np.uint8).view(np.uint32)[0] #type:ignore #pygame casts it
+    return colors.view(np.uint32)[:,:,0] != packed
+
+def get_nonempty_mask(surface:pygame.Surface, color_empty:RGB_OR_RGBA)->np.ndarray:
+    """_Returns a (w,h) boolean array telling which pixels of <surface> differ from <color_empty>."""
+    return get_different_mask(get_rgba_array(surface), color_empty)
+
+def get_first_pixels(mask:np.ndarray, axis:int, reverse:bool=False, n:int=1)->np.ndarray:
+    """_Returns a boolean array selecting, along <axis>, the <n> first True pixels of <mask>
+    (or the <n> last ones if <reverse> is True)."""
+    if reverse:
+        mask = np.flip(mask, axis)
+    selected = mask & (np.cumsum(mask, axis=axis) <= max(n, 1))
+    if reverse:
+        selected = np.flip(selected, axis)
+    return selected
+
+def draw_pixels_ip(surface:pygame.Surface, counts:np.ndarray, colors:Any)->None:
+    """_Draws on <surface> the pixels for which <counts> (array indexed by [x,y]) is positive, as if
+    gfx.pixel was called <counts> times on each of them. <colors> is either a single color or an array
+    with one color per pixel, in the order of np.nonzero(counts)."""
+    xs, ys = np.nonzero(counts)
+    if not len(xs):
+        return
+    colors = np.array(colors, dtype=np.float64)
+    if colors.ndim == 1:
+        colors = np.repeat(colors[np.newaxis], len(xs), axis=0)
+    colors = np.trunc(colors).astype(np.int64)
+    opaque = np.ones(len(xs), bool) if colors.shape[1] == 3 else colors[:,3] == 255
+    if surface.get_bitsize() in (24, 32):
+        pixels = surfarray.pixels3d(surface)
+        pixels[xs[opaque], ys[opaque]] = colors[opaque][:,0:3]
+        del pixels #unlocks surface
+        if surface.get_flags() & SRCALPHA:
+            alpha = surfarray.pixels_alpha(surface)
+            alpha[xs[opaque], ys[opaque]] = 255
+            del alpha #unlocks surface
+        to_blend = np.nonzero(~opaque)[0]
+    else:
+        to_blend = range(len(xs))
+    for i in to_blend: #translucent colors are blended by gfx.pixel
+        color = tuple(colors[i])
+        for k in range(int(counts[xs[i], ys[i]])):
+            gfx.pixel(surface, int(xs[i]), int(ys[i]), color)
+
 def draw_pixel_border_ip(surface:pygame.Surface,
                          border_color:RGB_OR_RGBA,
                          color_empty:RGB_OR_RGBA_OR_NONE=None)->None:
     """Draw a color outline around the external (non-transparent) shape of a surface.
-    This function is very slow and intended to be used once and for all before any loop,
-    most suitably on small sprites. The function uses the defined colorkey as <color_empty> by default."""
+    The function uses the defined colorkey as <color_empty> by default."""
     if not color_empty:
         color_empty = surface.get_colorkey()
     if not color_empty:
         raise Exception("You must provide <color_empty> or a surface with non-None colorkey")
-    w,h = surface.get_size()
-    def draw_pix_if_needed(x,y):
-        color = surface.get_at((x,y))
-        if color != color_empty:
-            gfx.pixel(surface, x, y, border_color) #this or surface.set_at() ?
-            return True
-    for x in range(w): #columns from top to bottom
-        for y in range(h):
-            if draw_pix_if_needed(x,y):
-                break
-    for y in range(h): #lines 
-        for x in range(w): #from left to right
-            if draw_pix_if_needed(x,y):
-                break
-        for x in range(w-1, -1, -1): #from right to left
-            if draw_pix_if_needed(x,y):
-                break
+    border, empty = pygame.Color(border_color), pygame.Color(color_empty) #type:ignore #pygame casts it
+    #the recolored pixels stay nonempty, unless border is blended or equal to empty color
+    same_shape = border.a == 255 and border != empty
+    nonempty = get_nonempty_mask(surface, color_empty) #type:ignore #guaranteed
+    #columns from top to bottom, then lines from left to right and from right to left
+    for axis, reverse in ((1, False), (0, False), (0, True)):
+        draw_pixels_ip(surface, get_first_pixels(nonempty, axis, reverse), border_color)
+        if not same_shape:
+            nonempty = get_nonempty_mask(surface, color_empty) #type:ignore #guaranteed
 
 
 def extract_pixel_border(surface:pygame.Surface, border_color:RGB_OR_RGBA,
                          color_empty:RGB_OR_RGBA_OR_NONE=None,
                          thickness:int=1)->pygame.Surface:
     """Return a surface containing only the outline around the external (non-transparent) shape of a surface.
-    This function is very slow and intended to be used once and for all before any loop,
-    most suitably on small sprites. The function uses the defined colorkey as <color_empty> by default,
+    The function uses the defined colorkey as <color_empty> by default,
     otherwise it looks at the color on the topleft pixel."""
     if not color_empty:
         color_empty = surface.get_colorkey()
@@ -865,70 +1072,41 @@ def extract_pixel_border(surface:pygame.Surface, border_color:RGB_OR_RGBA,
     new_surface = pygame.Surface((w,h))
     new_surface.set_colorkey(color_empty) #type:ignore #pygame does the cast
     new_surface.fill(color_empty) #type:ignore #pygame does the cast
-    if thickness != 1:
-        def draw_pix_if_needed(x,y):
-            color = surface.get_at((x,y))
-            if color != color_empty:
-                for ix in range(-1,2):
-                    for iy in range(-1,2):
-                        gfx.pixel(new_surface, x+ix, y+iy, border_color)
-                return True
-    else:
-        def draw_pix_if_needed(x,y):
-            color = surface.get_at((x,y))
-            if color != color_empty:
-                gfx.pixel(new_surface, x, y, border_color) #this or surface.set_at() ?
-                return True
-    for x in range(w): #columns from top to bottom
-        for y in range(h):
-            if draw_pix_if_needed(x,y):
-                break
-    for y in range(h): #lines 
-        for x in range(w): #from left to right
-            if draw_pix_if_needed(x,y):
-                break
-        for x in range(w-1, -1, -1): #from right to left
-            if draw_pix_if_needed(x,y):
-                break
+    nonempty = get_nonempty_mask(surface, color_empty) #type:ignore #guaranteed
+    #number of times each pixel is drawn
+    counts = get_first_pixels(nonempty, 1).astype(int)
+    counts += get_first_pixels(nonempty, 0)
+    counts += get_first_pixels(nonempty, 0, reverse=True)
+    if thickness != 1: #each border pixel is drawn with its 8 neighbours
+        padded = np.pad(counts, 1)
+        counts = sum([padded[1+ix:1+ix+w, 1+iy:1+iy+h] for ix in range(-1,2) for iy in range(-1,2)])
+    draw_pixels_ip(new_surface, counts, border_color)
     return new_surface
 
 
 def illuminate_border_ip(surface:pygame.Surface, light_color:RGB_OR_RGBA, orientation:str,
                          depth:int, intensity:float=0.5, color_empty:RGB_OR_RGBA_OR_NONE=None)->None:
-    """This function is very slow and intended to be used once and for all before any loop,
-    most suitably on small sprites. The function uses the defined colorkey as <color_empty> by default."""
+    """The function uses the defined colorkey as <color_empty> by default."""
     if not color_empty:
         color_empty = surface.get_colorkey()
     if not color_empty:
         raise Exception("You must provide <color_empty> or a surface with non-None colorkey")
     intensity = 1. - intensity
-    w,h = surface.get_size()
-    def draw_pix_if_needed(x,y):
-        color = surface.get_at((x,y))
-        if color != color_empty:
-            border_color = interpolate_2colors(color[0:len(light_color)], light_color, intensity)
-            gfx.pixel(surface, x, y, border_color) #this or surface.set_at() ?
-            return True
-    if "top" in orientation:
-        for x in range(w): #columns from top to bottom
-            for y in range(h):
-                if draw_pix_if_needed(x,y):
-                    break
-    for y in range(h): #lines 
-        if "left" in orientation:
-            n = 0
-            for x in range(w): #from left to right
-                if draw_pix_if_needed(x,y):
-                    n += 1
-                    if n >= depth:
-                        break
-        if "right" in orientation:
-            n = 0
-            for x in range(w-1, -1, -1): #from right to left
-                if draw_pix_if_needed(x,y):
-                    n += 1
-                    if n >= depth:
-                        break
+    n = len(light_color)
+    passes = [] #(axis, reverse, number of pixels)
+    if "top" in orientation: #columns from top to bottom
+        passes.append((1, False, 1))
+    if "left" in orientation: #lines from left to right
+        passes.append((0, False, depth))
+    if "right" in orientation: #lines from right to left
+        passes.append((0, True, depth))
+    for axis, reverse, n_pixels in passes:
+        nonempty = get_nonempty_mask(surface, color_empty) #type:ignore #guaranteed
+        selected = get_first_pixels(nonempty, axis, reverse, n_pixels)
+        #same as interpolate_2colors on each pixel
+        colors = get_rgba_array(surface)[selected][:,0:n].astype(np.float64)
+        colors = intensity*colors + (1. - intensity)*np.array(light_color, dtype=np.float64)
+        draw_pixels_ip(surface, selected, colors)
 
 
 
@@ -1120,42 +1298,29 @@ def render_outlined_text(text:str, font:pygame.font.Font,
 def darken_every_color_ip(surface:pygame.Surface,
                           factor:float=0.5,
                           color_empty:RGB_OR_RGBA_OR_NONE=None)->pygame.Surface:
-    """This function is very slow and intended to be used once and for all before any loop,
-    most suitably on small sprites. If <color_empty> is None, then it detects the default colorkey
-    of the surface."""
-    if not color_empty:
-        color_empty = surface.get_colorkey()
-    if not color_empty:
-        raise Exception("You must provide <color_empty> or a surface with non-None colorkey")
-    w,h = surface.get_size()
-    for x in range(w): #columns from top to bottom
-        for y in range(h):
-            color = surface.get_at((x,y))
-            if color != color_empty:
-                new_color = darken(color, factor) #type:ignore #pygame casts it
-                #maybe surface.set_at(...) is more performant than gfx.pixel
-                gfx.pixel(surface, x, y, new_color) #type:ignore #pygame casts it
-    return surface
+    """Darkens every pixel of the surface that is not <color_empty>.
+    If <color_empty> is None, then it detects the default colorkey of the surface."""
+    return darken_every_color_except_ip(surface, factor, [], color_empty)
 
 def darken_every_color_except_ip(surface:pygame.Surface,
                           factor:float=0.5,
                           except_colors:list[RGB_OR_RGBA_OR_NONE]=None,
                           color_empty:RGB_OR_RGBA_OR_NONE=None)->pygame.Surface:
-    """This function is very slow and intended to be used once and for all before any loop,
-    most suitably on small sprites. If <color_empty> is None, then it detects the default colorkey
-    of the surface."""
+    """Darkens every pixel of the surface that is neither <color_empty> nor one of the <except_colors>.
+    If <color_empty> is None, then it detects the default colorkey of the surface."""
     if not color_empty:
         color_empty = surface.get_colorkey()
     if not color_empty:
         raise Exception("You must provide <color_empty> or a surface with non-None colorkey")
-    w,h = surface.get_size()
-    for x in range(w): #columns from top to bottom
-        for y in range(h):
-            color = surface.get_at((x,y))
-            if color != color_empty and not(color in except_colors):
-                new_color = darken(color, factor) #type:ignore #pygame casts it
-                #maybe surface.set_at(...) is more performant than gfx.pixel
-                gfx.pixel(surface, x, y, new_color) #type:ignore #pygame casts it
+    assert factor <= 1
+    colors = get_rgba_array(surface)
+    selected = get_different_mask(colors, color_empty) #type:ignore #guaranteed
+    for color in except_colors or []:
+        selected &= get_different_mask(colors, color) #type:ignore #guaranteed
+    #same as darken on each pixel
+    colors = colors[selected].astype(np.float64)
+    colors[:,0:3] = np.trunc(colors[:,0:3]*factor)
+    draw_pixels_ip(surface, selected, colors)
     return surface
 
 
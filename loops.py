@@ -2,6 +2,8 @@ import pygame
 from typing import Optional, List, Dict, Callable, Tuple
 
 from . import parameters as p
+from . import statemanager
+from . import graphics
 
 
 class Loop:
@@ -29,6 +31,17 @@ class Loop:
         if manually_updated:
             loops.append(self)
         self.manually_updated:bool = manually_updated
+        self.dirty_rects_mode:bool = False #if True, the screen areas damaged by update are recorded
+        self.dirty_rects:List[pygame.Rect] = [] #screen areas damaged during the last update
+        self.idle_mode:bool = False #if True, launch waits for events when nothing is animated
+        self.idle_timeout:int = 500 #maximum time in ms spent waiting for events in idle mode
+        self.idle:bool = False #True if nothing happened during the last frame
+        self.accurate_sleep:bool = False #if True, use a busy loop for more accurate framerate control
+        self.timestep:Optional[float] = None #if not None, duration (ms) of the fixed logic step
+        self.max_steps_per_frame:int = 5
+        self.time_accumulator:float = 0.
+        self.freeze_to_update:bool = False #if True, elements of to_update are drawn from a snapshot
+        self.frozen_background:Optional[Tuple[pygame.Surface,pygame.Rect]] = None
         # self.reactions = {}
 
     # def user_is_allowed_to_click_again(self):
@@ -46,37 +59,51 @@ class Loop:
                no_state_change:bool=True,
                events:Optional[List[pygame.event.Event]]=None,
                func_after:Optional[Callable]=None,
-               mouse_rel:Optional[Tuple[int,int]]=None)->tuple[int,int]:
+               mouse_rel:Optional[Tuple[int,int]]=None,
+               inputs:Optional[p.InputSnapshot]=None)->tuple[int,int]:
         """Update and draw the thorpy elements. Returns the mouse_rel value.
         Method to call each frame of the game if you do not use automatic thorpy loops
         (typically, use this method in your own main loop, after drawing everything on the screen).
+        If self.dirty_rects_mode is True, the screen areas damaged since last call can then be obtained
+        with get_dirty_rects, so that you can call pygame.display.update(rects) instead of pygame.display.flip().
         ***Optional arguments***
         <events> : list of the events to handle from your pygame loop.
         <func_before> : function that is called before updating and drawing the elements.
         <func_after> : function that is called after updating and drawing the elements.
         <mouse_rel> : the change in position of the mouse since last call. If you dont indicate it,
         then Thorpy must call it. Otherwise, it just uses the value you give.
+        <inputs> : the state of the mouse and keyboard to use for this frame (see parameters.InputSnapshot).
+        If you dont indicate it, then Thorpy takes a snapshot of the devices. Giving it allows to replay
+        recorded inputs.
         """
         assert self.element
-        if self.fps > 0:
-            self.clock.tick(self.fps)
+        if self.dirty_rects_mode:
+            if p.dirty_rects is None: #first frame : the whole screen is damaged
+                p.dirty_rects = [p.screen.get_rect()] #type:ignore #screen is defined now
+        elif p.dirty_rects is not None: #another loop tracks damages, but this one updates the whole display
+            p.dirty_rects = [p.screen.get_rect()] #type:ignore #screen is defined now
+        self.tick()
+        p.animating = False
         if func_before:
             func_before()
         if mouse_rel is None:
-            mouse_rel = pygame.mouse.get_rel()
+            mouse_rel = inputs.rel if inputs else pygame.mouse.get_rel()
         if events is None:
             events = pygame.event.get()
         else:
             assert self.manually_updated
+        previous_inputs = p.inputs #this loop may be run from inside the update of another one
+        p.inputs = inputs if inputs else p.take_inputs_snapshot(mouse_rel)
         for e in events:
             self.reaction(e)
             if e.type == pygame.QUIT:
                 quit_all_loops()
                 pygame.event.post(pygame.event.Event(pygame.QUIT))
+                p.inputs = previous_inputs
                 return
             elif e.type == pygame.MOUSEBUTTONDOWN:
                 if self.click_outside_cancel:
-                    if not self.element.rect.collidepoint(pygame.mouse.get_pos()):
+                    if not self.element.rect.collidepoint(p.inputs.pos):
                         if self.element.at_cancel:
                             self.element.at_cancel()
                         if self.element.loop_give_back:
@@ -87,21 +114,28 @@ class Loop:
             elif e.type == pygame.KEYDOWN:
                 if e.key == pygame.K_ESCAPE and self.esc_quit:
                     quit_current_loop()
-            
-        if no_state_change:
-            for e in self.to_update: #reminder : to_update is not necessarily part of self.element's children
-                e.update_no_state_change(mouse_rel)
-                e.draw()
+        previous_steps = p.steps
+        p.steps = self.get_number_of_steps()
+        #inputs and states are handled every frame, even if no logic step is due
+        self.update_elements(no_state_change, mouse_rel)
+        steps, p.steps = p.steps, previous_steps
+        if self.freeze_to_update:
+            self.draw_frozen_background()
         else:
             for e in self.to_update:
-                e.update(mouse_rel)
                 e.draw()
-        self.element.update(mouse_rel)
         self.element.draw()
         if func_after:
             func_after()
         p.refresh()
+        statemanager.manager.apply_cursor()
+        p.inputs = previous_inputs
         self.iteration += 1
+        #animations are not known to be still if no step was performed
+        self.idle = not(events) and not(mouse_rel[0] or mouse_rel[1]) and not(p.animating) and steps > 0
+        if self.dirty_rects_mode:
+            self.dirty_rects = merge_rects(p.dirty_rects, p.screen.get_rect()) #type:ignore #guaranteed
+            p.dirty_rects = []
         return mouse_rel
 
     def launch(self,
@@ -117,15 +151,146 @@ class Loop:
         if func_before is None and p.current_func_before:
             func_before = p.current_func_before
         while self.playing:
+            if self.idle_mode and self.idle:
+                self.wait_for_events()
+            self.update(func_before, func_after=func_after) #update is in charge of the clock
+            if self.dirty_rects_mode:
+                pygame.display.update(self.dirty_rects)
+            else:
+                pygame.display.flip()
+        if p.dirty_rects is not None: #what was below self's elements must be redrawn by the next loop
+            p.dirty_rects.append(p.screen.get_rect()) #type:ignore #screen is defined now
+
+    def tick(self)->None:
+        """_Ticks the clock once for the current frame."""
+        if self.fps <= 0: #no framerate control, but frame time is still measured
+            self.clock.tick()
+        elif self.accurate_sleep:
+            self.clock.tick_busy_loop(self.fps)
+        else:
             self.clock.tick(self.fps)
-            self.update(func_before, func_after=func_after)
-            pygame.display.flip()
-            self.iteration += 1
+
+    def get_number_of_steps(self)->int:
+        """_Returns the number of logic steps to perform during the current frame and set parameters.dt."""
+        if not self.timestep:
+            p.dt = self.clock.get_time()
+            return 1
+        self.time_accumulator += self.clock.get_time()
+        n = int(self.time_accumulator // self.timestep)
+        self.time_accumulator -= n * self.timestep
+        if n > self.max_steps_per_frame: #app cannot keep up : drop the late steps
+            n = self.max_steps_per_frame
+            self.time_accumulator = 0.
+        p.dt = n * self.timestep
+        return n
+
+    def update_elements(self, no_state_change:bool, mouse_rel:Tuple[int,int])->None:
+        """_Updates the states of the elements, and advances their animations by parameters.steps."""
+        if no_state_change:
+            for e in self.to_update: #reminder : to_update is not necessarily part of self.element's children
+                e.update_no_state_change(mouse_rel)
+        else:
+            for e in self.to_update:
+                e.update(mouse_rel)
+        self.element.update(mouse_rel) #type:ignore #guaranteed
+
+    def draw_frozen_background(self)->None:
+        """_Draws the elements of to_update the first time, then blits the snapshot of the
+        screen area they cover."""
+        if self.frozen_background:
+            p.screen.blit(*self.frozen_background) #type:ignore #screen is defined now
+            return
+        for e in self.to_update:
+            e.draw()
+        rects = [d.get_damaged_rect() for e in self.to_update for d in e.get_all_descendants()]
+        if rects:
+            rect = rects[0].unionall(rects).clip(p.screen.get_rect()) #type:ignore #screen is defined now
+            self.frozen_background = (graphics.capture_screen(p.screen, rect), rect) #type:ignore
+
+    def set_frame_pacing(self,
+                         fps:Optional[int]=None,
+                         accurate_sleep:bool=False,
+                         timestep:Optional[float]=None,
+                         max_steps_per_frame:int=5)->None:
+        """Set how frames and logic steps are timed.
+        ***Optional arguments***
+        <fps> : (int) the framerate. If None, current framerate is kept.
+        <accurate_sleep> : (bool) if True, the clock uses a busy loop, which is more accurate but uses more CPU.
+        <timestep> : (float) if not None, elements are animated at a fixed rate (one step each <timestep> ms),
+        whatever the actual framerate is, so that animations speed stays the same under load. Inputs and
+        states are still handled every frame. The number of steps of the current frame is stored in
+        thorpy.parameters.steps, and the corresponding duration in thorpy.parameters.dt.
+        <max_steps_per_frame> : (int) maximum number of logic steps performed during one frame.
+        """
+        if fps is not None:
+            self.fps = fps
+        self.accurate_sleep = accurate_sleep
+        self.timestep = timestep
+        self.max_steps_per_frame = max_steps_per_frame
+        self.time_accumulator = 0.
+
+    def wait_for_events(self)->None:
+        """_Blocks until an event arrives or until idle_timeout is elapsed."""
+        event = pygame.event.wait(self.idle_timeout)
+        if event.type != pygame.NOEVENT:
+            events = [event] + pygame.event.get()
+            for e in events: #give them back, in the same order, to the next update
+                pygame.event.post(e)
+
+    def set_idle_mode(self, value:bool, timeout:int=500)->None:
+        """Activate or deactivate the idle mode of launch. In this mode, when no input arrived and nothing
+        was animated during the last frame, the loop stops redrawing and waits for the next event instead,
+        dropping CPU usage to almost zero for static menus.
+        Note that if your func_before draws animations, you must set thorpy.parameters.animating to True
+        each frame as long as they have to be drawn.
+        ***Mandatory arguments***
+        <value> : (bool) True to activate the mode.
+        ***Optional arguments***
+        <timeout> : (int) maximum time in milliseconds to wait for an event before drawing a new frame anyway.
+        """
+        self.idle_mode = value
+        self.idle_timeout = timeout
+
+    def set_dirty_rects_mode(self, value:bool)->None:
+        """Activate or deactivate the dirty rects mode. In this mode, the elements record the screen areas
+        they damage (state changes, animations, moves, text or surfaces changes), that are then given by
+        get_dirty_rects after each update.
+        <value> : (bool) True to activate the mode.
+        """
+        self.dirty_rects_mode = value
+        self.dirty_rects = []
+        if not value:
+            p.dirty_rects = None
+
+    def get_dirty_rects(self)->List[pygame.Rect]:
+        """Returns the screen areas damaged during the last update of the loop (in dirty rects mode only).
+        It is your responsibility to add to this list the areas that you modify yourself."""
+        return self.dirty_rects
 
 
 loops: List[Loop] = []
 
 
+def merge_rects(rects:List[pygame.Rect],
+                clip_rect:pygame.Rect,
+                max_rects:int=20)->List[pygame.Rect]:
+    """Returns a short list of rects covering all the given rects, clipped to clip_rect.
+    Overlapping rects are merged. If too many rects remain, their union is returned."""
+    merged:List[pygame.Rect] = []
+    for r in rects:
+        r = r.clip(clip_rect)
+        if r.w <= 0 or r.h <= 0:
+            continue
+        i = r.collidelist(merged)
+        while i >= 0:
+            r.union_ip(merged.pop(i))
+            i = r.collidelist(merged)
+        merged.append(r)
+    if len(merged) > max_rects:
+        return [merged[0].unionall(merged)]
+    return merged
+
+
 def pause(debug_msg:str="Thorpy pause - press a key to continue")->None:
     print(debug_msg)
     clock = pygame.time.Clock()
@@ -177,13 +342,18 @@ def loop_elements(main_element:"Element",
                     click_outside_cancel:bool=True,
                     reaction:Optional[pygame.event.Event]=None,
                     esc_quit:bool=True,
-                    func_after:Optional[Callable]=None)->None:
+                    func_after:Optional[Callable]=None,
+                    freeze_others:bool=False)->None:
+    parent_loop = get_current_loop()
     loop = Loop(main_element, manually_updated=False)
+    if parent_loop:
+        loop.set_idle_mode(parent_loop.idle_mode, parent_loop.idle_timeout)
     if reaction:
         loop.reaction = reaction #type:ignore #sorry for that
     loop.click_outside_cancel = click_outside_cancel
     loop.esc_quit = esc_quit
     loop.to_update = others
+    loop.freeze_to_update = freeze_others
     # old = get_current_loop()
     # if old:
     #     dt = old.iteration - old.last_click
@@ -1,6 +1,6 @@
 import pygame
 
-from typing import Optional, Callable, TYPE_CHECKING
+from typing import Optional, Callable, Dict, List, NamedTuple, Sequence, Tuple, TYPE_CHECKING
 if TYPE_CHECKING:
     from .canonical import Element
     from .elements import WaitingBar
@@ -22,11 +22,70 @@ element_being_dragged:Optional["Element"] = None
 
 waiting_bar:Optional["WaitingBar"] = None
 
+#Areas of the screen damaged since last display update. None means that damaged areas are not
+#tracked (no loop is in dirty rects mode).
+dirty_rects:Optional[List[pygame.Rect]] = None
+
+#Set to True during a frame by anything that needs the next frame to be drawn (animations, movements...).
+#Reset by the loops at the beginning of each frame, and used by their idle mode.
+animating:bool = False
+
+#Elements in relative positioning mode whose children have not followed their last moves yet.
+#See Element.set_relative_positioning.
+moved_elements:List["Element"] = []
+
+#Deferred layout and surfaces regeneration (see thorpy.batch) : elements to regenerate and to resort,
+#in the order they were recorded.
+batch_depth:int = 0
+batch_flushing:bool = False
+batch_generation:Dict["Element",None] = {} #used as an ordered set
+batch_resort:Dict["Element",None] = {} #used as an ordered set
+
+#If True, elements generate the surfaces of their hover, pressed and locked states only when they are
+#first needed (see Element.warm_up to generate them in advance). Set it before creating the elements.
+lazy_surfaces:bool = False
+
+#Duration (in ms) simulated during the current frame, set by the loop that updates the elements.
+dt:float = 0.
+#Number of logic steps simulated during the current frame : animations of the elements advance by this
+#number of steps, while their states are resolved once per frame. Always 1 without fixed timestep.
+steps:int = 1
+
+class InputSnapshot(NamedTuple):
+    """State of the mouse and keyboard at the beginning of a frame."""
+    pos:Tuple[int,int]
+    buttons:Tuple[bool,bool,bool]
+    rel:Tuple[int,int]
+    keys:Sequence[bool]
+    mods:int
+
+#Inputs of the frame being updated, built once per frame by the loop. None outside of the loops' update.
+inputs:Optional[InputSnapshot] = None
+
+def take_inputs_snapshot(rel:Tuple[int,int]=(0,0))->InputSnapshot:
+    """Returns a new snapshot of the current state of the mouse and keyboard.
+    <rel> : the change in position of the mouse since last frame."""
+    return InputSnapshot(pygame.mouse.get_pos(), pygame.mouse.get_pressed(), rel,
+                         pygame.key.get_pressed(), pygame.key.get_mods())
+
+def get_inputs()->InputSnapshot:
+    """Returns the inputs snapshot of the frame being updated.
+    If no loop is updating the elements, the current state of the devices is returned instead."""
+    if inputs is None:
+        return take_inputs_snapshot()
+    return inputs
+
 def refresh()->None:
     global element_being_dragged
-    if not pygame.mouse.get_pressed()[0]:
+    if not get_inputs().buttons[0]:
         element_being_dragged = None
 
+def resolve_positions()->None:
+    """Applies the pending moves of the elements in relative positioning mode to their descendants,
+    so that all the rects are up to date."""
+    while moved_elements:
+        moved_elements.pop().resolve_children_positions()
+
 def refresh_waiting_bar()->None:
     """Refreshes the waiting bar state, if any global waiting bar is set."""
     if waiting_bar:
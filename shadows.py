@@ -1,9 +1,11 @@
+import hashlib
 from math import tan, pi
 from pygame import Surface
 from pygame.transform import rotate, flip, scale
 
 from . import graphics
 from . import parameters as p
+from .diskcache import disk_cache
 
 
 
@@ -23,6 +25,7 @@ VERTICAL = True
 
 
 class Shadow:
+    persistent = True #whether the shadows generated are stored in the disk cache (see thorpy.set_disk_cache)
 
     def __init__(self):
         self.sun_angle = SUN_ANGLE
@@ -37,6 +40,20 @@ class Shadow:
         self.vertical = VERTICAL #rpg style : vertical=True
         self.color = SHADOW_COLOR
 
+    def get_image(self, target_img):
+        """Same as generate_image, but the shadow is loaded from the disk cache if the same generator
+        already generated it for the same image during a previous launch."""
+        if disk_cache.path is None or not self.persistent:
+            return self.generate_image(target_img)
+        digest = hashlib.sha1(target_img.get_buffer().raw).hexdigest()
+        key = (self, target_img.get_size(), target_img.get_bitsize(), target_img.get_flags(),
+               target_img.get_colorkey(), target_img.get_alpha(), digest)
+        entry = disk_cache.load(key)
+        if entry:
+            return entry[0][0]
+        shadow = self.generate_image(target_img)
+        disk_cache.save(key, [shadow])
+        return shadow
 
     def generate_image(self, target_img):
         r = target_img.get_rect()
@@ -70,6 +87,7 @@ class Shadow:
 
 
 class UniformRectShadow(Shadow):
+    persistent = False
 
     def generate_image(self, target_img):
         shadow = Surface(target_img.get_size())
@@ -80,6 +98,7 @@ class UniformRectShadow(Shadow):
 
 
 class NonUniformRectShadow(Shadow):
+    persistent = False
 
     def __init__(self):
         Shadow.__init__(self)
@@ -0,0 +1,111 @@
+"""Spatial index used to find quickly the elements lying under the mouse cursor.
+See Element.set_spatial_index."""
+from typing import Dict, List, Set, Tuple, TYPE_CHECKING
+if TYPE_CHECKING:
+    from .canonical import Element
+
+from . import parameters as p
+
+
+class SpatialIndex:
+    """Uniform grid of cells, each cell listing the elements whose rect overlaps it.
+    The index is owned by a root element and is kept in sync by the elements themselves :
+    moved or resized elements are reinserted lazily, and the whole index is rebuilt
+    when children are added or removed."""
+
+    def __init__(self, root:"Element", cell_size:int=64):
+        self.root = root
+        self.cell_size = cell_size
+        self.cells:Dict[Tuple[int,int],List["Element"]] = {}
+        self.element_cells:Dict["Element",List[Tuple[int,int]]] = {}
+        self.ranks:Dict["Element",int] = {} #rank of the element in the recursive update order
+        self.opaque:Set["Element"] = set() #elements with their own update logic (whole subtree updated)
+        self.always_updated:Set["Element"] = set() #opaque or animated elements
+        self.active:Set["Element"] = set() #elements hovered, pressed or dragged at last update
+        self.stale:Set["Element"] = set() #elements whose rect may have changed
+        self.must_rebuild:bool = True
+
+    def rebuild(self)->None:
+        for e in self.ranks:
+            e.hit_index = None
+        self.cells.clear()
+        self.element_cells.clear()
+        self.ranks.clear()
+        self.opaque.clear()
+        self.always_updated.clear()
+        self.stale.clear()
+        self.add_subtree(self.root)
+        self.must_rebuild = False
+
+    def add_subtree(self, element:"Element")->None:
+        if element is not self.root and element.has_custom_update():
+            self.opaque.add(element)
+        else:
+            for e in element.children:
+                self.add_subtree(e)
+        element.hit_index = self
+        self.ranks[element] = len(self.ranks) #children first, as in Element.update
+        self.insert(element)
+
+    def insert(self, element:"Element")->None:
+        if element in self.opaque or element.is_animated():
+            self.always_updated.add(element)
+            return
+        self.always_updated.discard(element)
+        cs = self.cell_size
+        r = element.rect
+        cells = [(x,y) for x in range(r.left//cs, (r.right-1)//cs + 1)
+                            for y in range(r.top//cs, (r.bottom-1)//cs + 1)]
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(element)
+        self.element_cells[element] = cells
+
+    def remove(self, element:"Element")->None:
+        for cell in self.element_cells.pop(element, ()):
+            self.cells[cell].remove(element)
+
+    def refresh(self)->None:
+        """Rebuilds the index if needed, otherwise reinserts the elements that moved."""
+        if self.must_rebuild:
+            self.rebuild()
+        elif self.stale:
+            for e in self.stale:
+                if e in self.ranks:
+                    self.remove(e)
+                    self.insert(e)
+            self.stale.clear()
+
+    def query(self, pos:Tuple[int,int])->List["Element"]:
+        """Returns the indexed elements whose rect contains <pos>."""
+        self.refresh()
+        cell = (pos[0]//self.cell_size, pos[1]//self.cell_size)
+        return [e for e in self.cells.get(cell, ()) if e.rect.collidepoint(pos)]
+
+    def update(self, mouse_delta)->bool:
+        """Updates the elements under the mouse, plus the ones that have to be updated anyway,
+        in the same order as the recursive Element.update. Returns True if root was dragged."""
+        candidates = set(self.query(p.get_inputs().pos))
+        candidates.update(self.always_updated)
+        candidates.update(self.active)
+        candidates.add(self.root)
+        ranks = self.ranks
+        candidates = sorted([e for e in candidates if e in ranks], key=ranks.__getitem__)
+        dragged_parents:Set["Element"] = set()
+        root_dragged = False
+        for e in candidates:
+            if e.has_locked_ancestor(self.root):
+                self.active.discard(e)
+                continue
+            if e in self.opaque:
+                dragged = e.update(mouse_delta)
+            else:
+                dragged = e.update_state(mouse_delta, e in dragged_parents)
+            if dragged and e.parent:
+                dragged_parents.add(e.parent)
+            if e.state == "hover" or e.state == "pressed" or e.being_dragged:
+                self.active.add(e)
+            else:
+                self.active.discard(e)
+            if e is self.root:
+                root_dragged = dragged
+        return root_dragged
@@ -0,0 +1,70 @@
+"""Central management of the mouse cursor and of the state transitions of the elements.
+The elements request the cursor they want during the update of a frame, and the cursor is
+actually set only when it changes at the end of the frame. The transitions of the elements
+(hover, unhover, click, unclick) can also be recorded in a queue that the application drains."""
+import pygame
+from typing import List, Optional, Tuple, TYPE_CHECKING
+if TYPE_CHECKING:
+    from .canonical import Element
+
+arrow_cursor = pygame.cursors.Cursor(pygame.SYSTEM_CURSOR_ARROW)
+
+
+class StateManager:
+
+    def __init__(self):
+        self.cursor:Optional[pygame.Cursor] = None #cursor set by thorpy (None if user's cursor is kept)
+        self.requested_cursor:Optional[pygame.Cursor] = None #cursor wanted during the current frame
+        self.record_transitions:bool = False
+        self.transitions:List[Tuple[str,"Element"]] = []
+
+    def request_cursor(self, cursor:pygame.Cursor)->None:
+        """Requests the cursor to show at the end of the current frame.
+        The first request of the frame wins : as children are updated before their parents,
+        the innermost element has the priority."""
+        if self.requested_cursor is None:
+            self.requested_cursor = cursor
+
+    def apply_cursor(self)->None:
+        """Sets the cursor requested during the frame, calling pygame only if the cursor changes.
+        If no cursor was requested, the arrow is restored only if thorpy changed the cursor before."""
+        cursor = self.requested_cursor
+        self.requested_cursor = None
+        if cursor is None:
+            if self.cursor is None:
+                return
+            cursor = arrow_cursor
+        if cursor != self.cursor:
+            pygame.mouse.set_cursor(cursor)
+        self.cursor = None if cursor == arrow_cursor else cursor
+
+    def push_transition(self, kind:str, element:"Element")->None:
+        """_Records a transition of <element>, if transitions are recorded. Identical transitions are
+        coalesced, and a hover followed by an unhover (or the reverse) of the same element cancel out."""
+        if not self.record_transitions:
+            return
+        transition = (kind, element)
+        if transition in self.transitions:
+            return
+        opposite = {"hover":"unhover", "unhover":"hover"}.get(kind)
+        if opposite and (opposite, element) in self.transitions:
+            self.transitions.remove((opposite, element))
+            return
+        self.transitions.append(transition)
+
+    def get_transitions(self)->List[Tuple[str,"Element"]]:
+        """Returns and clears the list of the transitions recorded since last call,
+        as (kind, element) tuples where kind is either 'hover', 'unhover', 'click' or 'unclick'."""
+        transitions = self.transitions
+        self.transitions = []
+        return transitions
+
+    def set_transitions_recording(self, value:bool=True)->None:
+        """Set whether the transitions of the elements are recorded. See get_transitions.
+        <value> : (bool) True to record transitions."""
+        self.record_transitions = value
+        if not value:
+            self.transitions.clear()
+
+
+manager = StateManager()
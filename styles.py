@@ -3,12 +3,14 @@ import warnings
 
 import pygame.gfxdraw as gfx
 import pygame
+from collections import OrderedDict
 from typing import Optional
 
 from . import parameters as p
 from .graphics import darken, enlighten
 from . import graphics
 from .shadows import Shadow
+from .diskcache import disk_cache
 
 
 
@@ -38,7 +40,7 @@ def get_trigon(rtrig, arrow):
 
 def get_font(obj):
     if not obj.__class__.font:
-        return pygame.font.SysFont(p.fallback_font_name, p.fallback_font_size)
+        return get_sysfont(p.fallback_font_name, p.fallback_font_size)
     else:
         return obj.__class__.font
 
@@ -63,15 +65,33 @@ def get_first_existing_font(fontnames):
         if fontname in all_fonts:
             return fontname
 
+fonts = {} #fonts shared by the styles, for each (sysfont, name, size, bold, italic)
+
 def generate_font(font_name, font_size, bold=False, italic=False):
-    try:
+    """Returns the font with the given name or path and size. The font is built only once for each
+    combination of arguments, and then shared : do not modify it (e.g. with set_bold)."""
+    key = (False, font_name, font_size, bold, italic)
+    font = fonts.get(key)
+    if font is None:
         try:
-            font = pygame.font.Font(font_name, font_size)
+            try:
+                font = pygame.font.Font(font_name, font_size)
+            except:
+                font = get_sysfont(font_name, font_size)
         except:
-            font = pygame.font.SysFont(font_name, font_size)
-    except:
-        warnings.warn("Couldn't generate font:" + str(font_name) + str(font_size))
-        font = pygame.font.SysFont(p.fallback_font_name, font_size, bold, italic)
+            warnings.warn("Couldn't generate font:" + str(font_name) + str(font_size))
+            font = get_sysfont(p.fallback_font_name, font_size, bold, italic)
+        fonts[key] = font
+    return font
+
+def get_sysfont(font_name, font_size, bold=False, italic=False):
+    """Same as pygame.font.SysFont, but the system fonts are looked up only once for each
+    combination of arguments, and the font is then shared : do not modify it."""
+    key = (True, font_name, font_size, bold, italic)
+    font = fonts.get(key)
+    if font is None:
+        font = pygame.font.SysFont(font_name, font_size, bold, italic)
+        fonts[key] = font
     return font
 
 def get_default_font(style=None):
@@ -102,6 +122,179 @@ def get_text_size(text, cls=None):
         cls = Text
     return cls.style_normal.font.size(text)
 
+class SurfaceCache:
+    """LRU cache of the surfaces generated by the styles, shared by the whole process.
+    Elements whose style, text and size are identical then share the same surfaces.
+    Entries are evicted when the total size of the cached surfaces exceeds max_bytes."""
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes #0 means that the cache is disabled
+        self.entries = OrderedDict()
+        self.entries_bytes = {}
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, surfaces, side_effects):
+        n_bytes = sum([s.get_pitch()*s.get_height() for s in surfaces])
+        if n_bytes > self.max_bytes:
+            return
+        if key in self.entries:
+            self.n_bytes -= self.entries_bytes[key]
+        self.entries[key] = (tuple(surfaces), side_effects)
+        self.entries_bytes[key] = n_bytes
+        self.n_bytes += n_bytes
+        while self.n_bytes > self.max_bytes:
+            old_key, old_entry = self.entries.popitem(last=False)
+            self.n_bytes -= self.entries_bytes.pop(old_key)
+
+    def clear(self):
+        self.entries.clear()
+        self.entries_bytes.clear()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self):
+        """Returns a dict with the number of hits, misses, entries and bytes used by the cache."""
+        return {"hits":self.hits, "misses":self.misses, "entries":len(self.entries),
+                "bytes":self.n_bytes, "max_bytes":self.max_bytes}
+
+surface_cache = SurfaceCache()
+fingerprint_names = {} #names of the attributes defining the look of the styles, for each style class
+NOT_FINGERPRINTED = {"r_text", "text_lines", "rtext", "shadowgen", "cacheable"}
+word_widths = {} #widths of the words wrapped by the styles, for each font
+MAX_CACHED_WORDS = 10000 #per font
+compiled_rich_texts = {} #runs of the rich texts, for each (tag, text)
+rich_layouts = {} #lines of the wrapped rich texts (as tuples), for each (font, tag, text, color, width)
+MAX_CACHED_RICH_TEXTS = 1000
+
+def compile_rich_text(tag, text):
+    """_Returns the runs of the rich <text> as a tuple of (text, color), where color is None for the runs
+    using the font color of the style. Compiled texts are cached per (tag, text)."""
+    key = (tag, text)
+    runs = compiled_rich_texts.get(key)
+    if runs is None:
+        L = len(COLOR_TAG)
+        runs = []
+        for part in text.split(tag):
+            color = None
+            if part.startswith(COLOR_TAG):
+                i_start = L + 1
+                i_end = part.index(")")
+                if i_end > i_start:
+                    color_str = part[i_start:i_end]
+                    color = tuple(map(int, color_str.split(',')))
+                runs.append((part[i_end+1:], color))
+            else:
+                runs.append((part, color))
+        runs = tuple(runs)
+        if len(compiled_rich_texts) >= MAX_CACHED_RICH_TEXTS:
+            compiled_rich_texts.clear()
+        compiled_rich_texts[key] = runs
+    return runs
+
+def set_surface_cache_size(max_bytes):
+    """Set the maximum memory used by the cache of the surfaces generated by the styles.
+    When the cache is enabled, elements that look exactly the same (same style, text and size)
+    share the same surfaces, which saves a lot of time and memory when many similar elements are built.
+    Caution : in this case, you must not draw directly on the surfaces of the elements.
+    <max_bytes> : (int) maximum size of the cache in bytes. 0 disables the cache (default)."""
+    surface_cache.max_bytes = max_bytes
+    if not max_bytes:
+        surface_cache.clear()
+
+def get_surface_cache_stats():
+    """Returns a dict with the statistics of the cache of the surfaces generated by the styles."""
+    return surface_cache.get_stats()
+
+text_cache = SurfaceCache(2**21) #rendered text lines, which are never drawn on
+
+def set_text_cache_size(max_bytes):
+    """Set the maximum memory used by the cache of the rendered lines of text. Identical lines of text
+    rendered with the same font and color (repeated labels, texts refreshed every frame...) are then
+    rasterized only once.
+    <max_bytes> : (int) maximum size of the cache in bytes. 0 disables the cache. Default is 2 MB."""
+    text_cache.max_bytes = max_bytes
+    if not max_bytes:
+        text_cache.clear()
+
+def get_text_cache_stats():
+    """Returns a dict with the statistics of the cache of the rendered lines of text."""
+    return text_cache.get_stats()
+
+def render_text(font, text, antialias, color):
+    """Returns font.render(text, antialias, color), taken from the cache of the rendered lines of text
+    if possible. The surface may be shared : blit it but do not draw on it."""
+    if not text_cache.max_bytes:
+        return font.render(text, antialias, color)
+    key = (font, font.get_bold(), font.get_italic(), font.get_underline(), text, antialias, color)
+    try:
+        entry = text_cache.get(key)
+    except TypeError: #unhashable color
+        return font.render(text, antialias, color)
+    if entry:
+        return entry[0][0]
+    surface = font.render(text, antialias, color)
+    text_cache.put(key, [surface], None)
+    return surface
+
+
+class GlyphAtlas:
+    """Glyphs of a font rendered once for a given color, then composed into texts by blitting them.
+    Kerning is ignored, so this is meant for short texts changing very often, such as numbers."""
+
+    def __init__(self, font, antialias, color, charset=""):
+        self.font = font
+        self.antialias = antialias
+        self.color = color
+        self.glyphs = {}
+        for char in charset:
+            self.get_glyph(char)
+
+    def get_glyph(self, char):
+        """Returns the surface of <char>, rendering it the first time."""
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            glyph = self.glyphs[char] = self.font.render(char, self.antialias, self.color)
+        return glyph
+
+    def get_size(self, text):
+        return sum([self.get_glyph(char).get_width() for char in text]), self.font.get_height()
+
+    def blit(self, surface, text, pos):
+        """Blits <text> on <surface> at <pos>, with a single call to Surface.blits."""
+        x, y = pos
+        sequence = []
+        for char in text:
+            glyph = self.get_glyph(char)
+            sequence.append((glyph, (x, y)))
+            x += glyph.get_width()
+        surface.blits(sequence, doreturn=False)
+
+glyph_atlases = {} #for each (font, antialias, color)
+
+def get_glyph_atlas(font, antialias, color, charset=""):
+    """Returns the glyph atlas shared by the texts using the given font, antialias and color.
+    <charset> : characters whose glyphs are rendered now (the others are rendered when needed)."""
+    key = (font, antialias, tuple(color))
+    atlas = glyph_atlases.get(key)
+    if atlas is None:
+        atlas = glyph_atlases[key] = GlyphAtlas(font, antialias, color)
+    for char in charset:
+        atlas.get_glyph(char)
+    return atlas
+
+
 class BaseStyle:
     font = None
     font_antialias = True
@@ -118,6 +311,7 @@ class BaseStyle:
     shadowgen:Optional[Shadow] = None
     offset = (0,0)
     radius = 0
+    cacheable = True #False for styles whose images cannot be shared (random or image-based)
     # draw_in_2_times = False
 
     def __init__(self): #en chantier, a tester sur example thorpy
@@ -139,6 +333,61 @@ class BaseStyle:
     def generate_images(self, img, arrow=False):
         raise Exception("BaseStyle cannot be used as a Style (it is abstract).")
 
+    def get_images(self, text, arrow=False):
+        """_Same as generate_images, but the surfaces are taken from the surface cache or from the disk cache
+        if an identical style already generated them. Returns a new list, whose surfaces may be shared."""
+        use_disk = disk_cache.path is not None
+        if not((surface_cache.max_bytes or use_disk) and self.is_cacheable()):
+            return self.generate_images(text, arrow)
+        key = (self.get_fingerprint(), text, arrow)
+        try:
+            entry = surface_cache.get(key) if surface_cache.max_bytes else None
+        except TypeError: #unhashable attribute
+            return self.generate_images(text, arrow)
+        if not entry and use_disk:
+            entry = disk_cache.load(key)
+            if entry and surface_cache.max_bytes:
+                surface_cache.put(key, entry[0], entry[1])
+        if entry:
+            surfaces, side_effects = entry
+            for name, value in side_effects.items():
+                if isinstance(value, pygame.Rect):
+                    value = value.copy()
+                setattr(self, name, value)
+            return list(surfaces)
+        before = dict(self.__dict__)
+        surfaces = self.generate_images(text, arrow)
+        side_effects = {}
+        for name, value in self.__dict__.items():
+            if not(name in before and before[name] is value):
+                if isinstance(value, pygame.Rect):
+                    value = value.copy()
+                side_effects[name] = value
+        if surface_cache.max_bytes:
+            surface_cache.put(key, surfaces, side_effects)
+        if use_disk:
+            disk_cache.save(key, surfaces, side_effects)
+        return surfaces
+
+    def is_cacheable(self):
+        return self.cacheable
+
+    def get_fingerprint(self):
+        """Returns a hashable tuple identifying the look of the images generated by the style :
+        two styles with the same fingerprint generate the same images for the same text."""
+        names = fingerprint_names.get(self.__class__)
+        if names is None:
+            names = set()
+            for cls in self.__class__.__mro__:
+                for name, value in cls.__dict__.items():
+                    if not(name.startswith("_") or callable(value) or isinstance(value, (classmethod, staticmethod))):
+                        names.add(name)
+            names = tuple(sorted(names - NOT_FINGERPRINTED))
+            fingerprint_names[self.__class__] = names
+        d = self.__dict__
+        extra = tuple(sorted([(k, v) for k,v in d.items() if k not in names and k not in NOT_FINGERPRINTED]))
+        return (self.__class__, tuple([getattr(self, name) for name in names]), extra)
+
     def autoset_has_second_draw(self):
         color = graphics.get_main_color(self.bck_color)
         print("autoset", color)
@@ -190,49 +439,31 @@ class BaseStyle:
         return self.font.get_height()
 
     def process_rich_text(self, text):
-        L = len(COLOR_TAG)
-        s = text.split(self.font_rich_text_tag)
-        new_parts = []
-        for part in s:
-            color = self.font_color
-            if part.startswith(COLOR_TAG):
-                i_start = L + 1
-                i_end = part.index(")")
-                if i_end > i_start:
-                    color_str = part[i_start:i_end]
-                    color = tuple(map(int, color_str.split(',')))
-                new_parts.append((part[i_end+1:], color))
-            else:
-                new_parts.append((part, color))
-        return new_parts
+        color = self.font_color
+        return [(part, color if c is None else c) for part, c in compile_rich_text(self.font_rich_text_tag, text)]
 
     def process_rich_lines(self, lines):
-        new_lines = []
-        L = len(COLOR_TAG)
-        for line in lines:
-            s = line.split(self.font_rich_text_tag)
-            new_parts = []
-            for part in s:
-                color = self.font_color
-                if part.startswith(COLOR_TAG):
-                    i_start = L + 1
-                    i_end = part.index(")")
-                    if i_end > i_start:
-                        color_str = part[i_start:i_end]
-                        color = tuple(map(int, color_str.split(',')))
-                    new_parts.append((part[i_end+1:], color))
-                else:
-                    new_parts.append((part, color))
-            new_lines.append(new_parts)
-        return new_lines
+        return [self.process_rich_text(line) for line in lines]
 
     def extract_lines_from_text(self, text):
         if self.font_rich_text_tag:
-            rich_text = self.process_rich_text(text)
             if self.font_auto_multilines_width > 0:
-                lines = self.autocut_rich_text(rich_text, self.font_auto_multilines_width - 2*self.margins[0])
+                max_w = self.font_auto_multilines_width - 2*self.margins[0]
+                key = (self.font, self.font_rich_text_tag, text, self.font_color, max_w)
+                try:
+                    lines = rich_layouts.get(key)
+                except TypeError: #unhashable color
+                    key, lines = None, None
+                if lines is None:
+                    lines = self.autocut_rich_text(self.process_rich_text(text), max_w)
+                    if key:
+                        if len(rich_layouts) >= MAX_CACHED_RICH_TEXTS:
+                            rich_layouts.clear()
+                        rich_layouts[key] = tuple([tuple(line) for line in lines]) #cannot be altered by users
+                else: #each caller gets its own lists
+                    lines = [list(line) for line in lines]
             else:
-                lines = self.split_linebreak_rich_text(rich_text)
+                lines = self.split_linebreak_rich_text(self.process_rich_text(text))
         else:
             if self.font_auto_multilines_width > 0:
                 lines = self.autocut_text(text, self.font_auto_multilines_width - 2*self.margins[0])
@@ -240,64 +471,152 @@ class BaseStyle:
                 lines = text.split("\n")
         return lines
 
-    def autocut_text(self, text, max_w, sep=" ", newline_symbol="\n"):
+    def get_word_width(self, word):
+        """_Returns the width of <word> rendered with the font of the style. Widths are cached per font."""
+        widths = word_widths.get(self.font)
+        if widths is None:
+            widths = word_widths[self.font] = {}
+        w = widths.get(word)
+        if w is None:
+            if len(widths) >= MAX_CACHED_WORDS:
+                widths.clear()
+            w = widths[word] = self.font.size(word)[0]
+        return w
+
+    def get_junction_error(self):
+        """_Returns the maximum difference between the width of two words measured together and the sum
+        of their widths measured separately (kerning and rounding)."""
+        return 1 + self.get_font_height()//10
+
+    def exceeds(self, width, error, pieces, max_w, measure):
+        """_Returns (True if the text made of <pieces> is wider than <max_w>, width, error), where <width>
+        is the estimated width of the text, known up to <error>. The text is measured with <measure>
+        only if the estimation is too close to <max_w> to decide, and then the exact width is returned."""
+        if width - error > max_w:
+            return True, width, error
+        elif width + error <= max_w:
+            return False, width, error
+        width = measure("".join(pieces))[0]
+        return width > max_w, width, 0
+
+    def cut_word(self, word, max_w):
+        """_Returns the parts of <word> whose widths do not exceed <max_w> (each part has at least one
+        character). Each cut is found by binary search on the length of the part."""
+        parts = []
+        while len(word) > 1 and self.font.size(word)[0] > max_w:
+            lo, hi = 1, len(word) - 1 #lo is the largest length known to fit (or 1)
+            while lo < hi:
+                mid = (lo + hi + 1)//2
+                if self.font.size(word[:mid])[0] <= max_w:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            parts.append(word[:lo])
+            word = word[lo:]
+        parts.append(word)
+        return parts
+
+    def autocut_text(self, text, max_w, sep=" ", newline_symbol="\n", cut_long_words=False):
         """_Return a list of strings with one line per element in order to make line length
-        not exceed <max_w>."""
+        not exceed <max_w>. Each word is measured once and the widths of the lines are accumulated ;
+        a line is measured as a whole only when its accumulated width is too close to <max_w> to decide.
+        If <cut_long_words> is True, the words that do not fit on a line are cut."""
+        measure = self.get_line_size
+        extra = measure("")[0] #width of an empty line
+        sep_w = self.get_word_width(sep)
+        junction_error = self.get_junction_error()
         lines = []
-        current_line = ""
-        current_line_w = 0
+        current_line = [] #pieces of the current line
+        current_line_w, error = extra, 0 #estimated width of the current line, up to error
         for words in text.split(sep):
             break_split = words.split(newline_symbol)
             for i,word in enumerate(break_split):
-                if word:
-                    new_line_value = current_line + word + sep
+                if word and cut_long_words and extra + self.get_word_width(word) > max_w:
+                    parts = self.cut_word(word, max_w - extra)
+                    if i > 0 or current_line:
+                        lines.append("".join(current_line))
+                    lines.extend(parts[:-1])
+                    current_line = [parts[-1], sep]
+                    current_line_w = extra + self.get_word_width(parts[-1]) + sep_w
+                    error = junction_error
+                    continue
+                if i > 0:
+                    too_large = True
+                elif word:
+                    too_large, w, e = self.exceeds(current_line_w + self.get_word_width(word) + sep_w,
+                                                   error + 2*junction_error,
+                                                   current_line + [word, sep], max_w, measure)
                 else:
-                    new_line_value = current_line
-                current_line_w = self.get_line_size(new_line_value)[0]
-                if i>0 or current_line_w > max_w:
-                    lines.append(current_line)
+                    too_large, w, e = self.exceeds(current_line_w, error, current_line, max_w, measure)
+                if too_large:
+                    lines.append("".join(current_line))
                     if word:
-                        current_line = word + sep #next one will start with word
+                        current_line = [word, sep] #next one will start with word
+                        current_line_w = extra + self.get_word_width(word) + sep_w
+                        error = junction_error
                     else:
-                        current_line = ""
-                    current_line_w = 0
+                        current_line = []
+                        current_line_w, error = extra, 0
                 else:
-                    current_line = new_line_value
-        lines.append(current_line)
+                    if word:
+                        current_line += [word, sep]
+                    current_line_w, error = w, e
+        lines.append("".join(current_line))
         return lines
 
     def autocut_rich_text(self, rich_text, max_w, sep=" ", newline_symbol="\n"):
         """_Return rich lines with line breaks inserted in order to make line length
-        not exceed <max_w>."""
+        not exceed <max_w>. As in autocut_text, each word is measured once."""
+        measure = self.font.size
+        sep_w = self.get_word_width(sep)
+        junction_error = self.get_junction_error()
         lines = []  #[  [(txt, color), (txt,color), ...],  [(txt, color), (txt,color), ...]]
         current_line = []
-        current_line_txt = ""
-        current_line_w = 0
+        current_line_txt = [] #pieces of the text of the current line
+        txt_w, txt_error = 0, 0 #estimated width of the text of the current line, up to txt_error
+        #the width compared to max_w at the beginning of a part is either the width of the text of the line,
+        #or the width of the last word.
+        last_w_is_txt, last_w = False, 0
         for k,data in enumerate(rich_text):
             words, color = data
             current_line.append(["",color]) #laisse des dechets innoffenssifs normalement
             break_split = words.split(newline_symbol)
             for i,part in enumerate(break_split):
-                if i>0 or current_line_w > max_w:
+                if i > 0:
+                    too_large = True
+                elif last_w_is_txt:
+                    too_large, txt_w, txt_error = self.exceeds(txt_w, txt_error, current_line_txt, max_w, measure)
+                else:
+                    too_large = last_w > max_w
+                if too_large:
                     lines.append(current_line)
                     current_line = [["", color]]
-                    current_line_w = 0
-                    current_line_txt = ""
+                    current_line_txt = []
+                    txt_w, txt_error = 0, 0
+                    last_w_is_txt, last_w = False, 0
                 for j,word in enumerate(part.split(sep)):
+                    word_w = self.get_word_width(word)
                     if j > 0:
-                        added = sep + word
-                        current_line_w = self.font.size(current_line_txt + added)[0]
-                    else:
-                        current_line_w = self.font.size(word)[0]
-                        added = word
-                    if current_line_w > max_w and j > 0:
-                        lines.append(current_line)
-                        current_line = [[word, color]]
-                        current_line_w = 0
-                        current_line_txt = word
+                        too_large, w, e = self.exceeds(txt_w + sep_w + word_w, txt_error + 2*junction_error,
+                                                       current_line_txt + [sep, word], max_w, measure)
+                        if too_large:
+                            lines.append(current_line)
+                            current_line = [[word, color]]
+                            current_line_txt = [word]
+                            txt_w, txt_error = word_w, 0
+                            last_w_is_txt, last_w = False, 0
+                        else:
+                            current_line[-1][0] += sep + word
+                            current_line_txt += [sep, word]
+                            txt_w, txt_error = w, e
+                            last_w_is_txt = True
                     else:
-                        current_line[-1][0] += added
-                        current_line_txt += added
+                        current_line[-1][0] += word
+                        if current_line_txt:
+                            txt_error += junction_error
+                        current_line_txt.append(word)
+                        txt_w += word_w
+                        last_w_is_txt, last_w = False, word_w
         lines.append(current_line)
         return lines
 
@@ -315,8 +634,8 @@ class BaseStyle:
             lines.append(current_line)
         return lines
 
-    def insert_auto_breakline(self, text, max_w, sep=" ", newline_symbol="\n"):
-        lines = self.autocut_text(text, max_w, sep=" ", newline_symbol="\n")
+    def insert_auto_breakline(self, text, max_w, sep=" ", newline_symbol="\n", cut_long_words=False):
+        lines = self.autocut_text(text, max_w, sep=" ", newline_symbol="\n", cut_long_words=cut_long_words)
         return newline_symbol.join(lines)
 
 
@@ -336,7 +655,7 @@ class BaseStyle:
         return self.r_text, self.text_lines
     
     def font_render(self, text, color):
-        return self.font.render(text, self.font_antialias, color)
+        return render_text(self.font, text, self.font_antialias, color)
 
     def get_rendered_text(self, lines):
         if self.font_rich_text_tag:
@@ -480,6 +799,7 @@ class BaseStyle:
 
 class ImageStyle(BaseStyle):
     margins = (0,0)
+    cacheable = False
 
     def generate_images(self, img, arrow=False) -> list[pygame.Surface]:
         self.text_lines = ""
@@ -491,6 +811,7 @@ class ImageStyle(BaseStyle):
 class ImageStyleWithText(BaseStyle):
     font_color = (255,)*3
     bck_color = (0,)*4
+    cacheable = False
 
     def generate_images(self, img, text, arrow=False):
         infl = (self.margins[0]*2, self.margins[1]*2)
@@ -518,6 +839,7 @@ class ImageStyleWithText(BaseStyle):
 
 class MultipleImagesStyle(BaseStyle):
     margins = (0,0)
+    cacheable = False
 
     def generate_images(self, imgs, arrow=False):
         self.text_lines = ""
@@ -943,7 +1265,9 @@ class GameStyle1(TextStyle):
         super().__init__()
         # self.nframes = 1
         # self.frame_mod = 1 #mandatory frame_mod > 0 for animations
-        
+
+    def is_cacheable(self):
+        return self.cacheable and self.mod_offset != "random"
     
     def generate_images(self, text, arrow=False):
         surfaces = []
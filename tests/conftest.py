@@ -0,0 +1,25 @@
+import os, sys, importlib.util
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_thorpy():
+    """Imports the package from this tree, whatever the name of its directory."""
+    if "thorpy" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("thorpy", os.path.join(ROOT, "__init__.py"),
+                                                      submodule_search_locations=[ROOT])
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["thorpy"] = module
+        spec.loader.exec_module(module)
+    return sys.modules["thorpy"]
+
+@pytest.fixture(scope="session")
+def tp():
+    #pygame is not quit between tests, as fonts and surfaces are cached by thorpy
+    pygame.init()
+    screen = pygame.display.set_mode((800, 600))
+    thorpy = import_thorpy()
+    thorpy.init(screen, thorpy.theme_human)
+    return thorpy
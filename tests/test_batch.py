@@ -0,0 +1,105 @@
+"""Elements built inside a batch must end up as if they were built outside of it."""
+import pygame
+import pytest
+
+
+def get_surface():
+    surface = pygame.Surface((30, 20))
+    surface.fill((200, 0, 0))
+    return surface
+
+STOCK_ELEMENTS = {
+    "Alert": lambda tp: tp.Alert("Title", "Some text"),
+    "AlertWithChoices": lambda tp: tp.AlertWithChoices("Title", ["yes", "no"]),
+    "ArrowButton": lambda tp: tp.ArrowButton("left", (20, 20)),
+    "Box": lambda tp: tp.Box([tp.Button("a"), tp.Button("bb")]),
+    "Button": lambda tp: tp.Button("ok"),
+    "Checkbox": lambda tp: tp.Checkbox(True),
+    "ColorPicker": lambda tp: tp.ColorPicker(),
+    "ColorPickerPredefined": lambda tp: tp.ColorPickerPredefined(),
+    "ColorPickerRGB": lambda tp: tp.ColorPickerRGB(),
+    "DeadButton": lambda tp: tp.DeadButton("dead"),
+    "DiscreteLifebar": lambda tp: tp.DiscreteLifebar(get_surface(), get_surface(), 5, 3),
+    "DropDownListButton": lambda tp: tp.DropDownListButton(("a", "b", "c")),
+    "Group": lambda tp: tp.Group([tp.Button("a"), tp.Text("b")], "h"),
+    "HeterogeneousTexts": lambda tp: tp.HeterogeneousTexts([("big", {"size":20}), ("red", {"color":(255,0,0)})]),
+    "Image": lambda tp: tp.Image(get_surface()),
+    "ImageButton": lambda tp: tp.ImageButton("image", get_surface()),
+    "Labelled": lambda tp: tp.Labelled("label", tp.Button("x")),
+    "LabelledColorPicker": lambda tp: tp.LabelledColorPicker("color", tp.ColorPicker()),
+    "Lifebar": lambda tp: tp.Lifebar("life", 200),
+    "Line": lambda tp: tp.Line("h", 100),
+    "ListView": lambda tp: tp.ListView(("a", "b", "c"), "a"),
+    "OutlinedText": lambda tp: tp.OutlinedText("outlined"),
+    "Radio": lambda tp: tp.Radio(),
+    "Sketch": lambda tp: tp.Sketch((4, 4), (10, 10)),
+    "Slider": lambda tp: tp.Slider("h", 100),
+    "SliderWithText": lambda tp: tp.SliderWithText("value", 0, 10, 5, 100),
+    "SwitchButton": lambda tp: tp.SwitchButton(),
+    "SwitchButtonWithText": lambda tp: tp.SwitchButtonWithText("switch", ("on", "off")),
+    "Text": lambda tp: tp.Text("hello\nworld"),
+    "TextAndImageButton": lambda tp: tp.TextAndImageButton("image", get_surface()),
+    "TextInput": lambda tp: tp.TextInput("abc", "placeholder"),
+    "TitleBox": lambda tp: tp.TitleBox("Title", [tp.Button("a"), tp.Button("bb")]),
+    "TogglablesPool": lambda tp: tp.TogglablesPool("pool", ("a", "b", "c"), "b"),
+    "ToggleButton": lambda tp: tp.ToggleButton("toggle"),
+    "VerticalLifebar": lambda tp: tp.VerticalLifebar("life", 200),
+    "WaitingBar": lambda tp: tp.WaitingBar("wait"),
+}
+
+def get_layout(element):
+    """Returns the rects of element and of its descendants, relative to element's topleft corner."""
+    x, y = element.rect.topleft
+    return [(e.__class__.__name__, e.rect.move(-x, -y)) for e in element.get_all_descendants()]
+
+
+def build_lifebar(tp):
+    return tp.Lifebar("life", 200)
+
+def build_box(tp):
+    return tp.Box([tp.Button("a"), tp.Button("b"), tp.Text("hello\nworld\nthree lines")])
+
+def build_ddlb(tp):
+    return tp.DropDownListButton(("a", "b"))
+
+
+def test_lifebar_in_batch(tp):
+    expected = build_lifebar(tp)
+    with tp.batch():
+        lifebar = build_lifebar(tp)
+    assert lifebar.rect.size == expected.rect.size
+    assert lifebar.e_rect.rect.size == expected.e_rect.rect.size
+    assert lifebar.e_frame.rect.size == expected.e_frame.rect.size
+    expected.sort_children()
+    with tp.batch():
+        lifebar.sort_children() #sorted by the override, with its default arguments
+    assert lifebar.rect.size == expected.rect.size
+    assert lifebar.e_rect.rect.topleft == expected.e_rect.rect.move(lifebar.rect.x - expected.rect.x,
+                                                                   lifebar.rect.y - expected.rect.y).topleft
+
+def test_box_in_batch(tp):
+    expected = build_box(tp)
+    with tp.batch():
+        box = build_box(tp)
+    assert box.rect.size == expected.rect.size
+    assert box.children_rect.size == expected.children_rect.size
+    assert [e.rect.size for e in box.children] == [e.rect.size for e in expected.children]
+
+def test_dropdownlistbutton_in_batch(tp):
+    expected = build_ddlb(tp)
+    with tp.batch():
+        ddlb = build_ddlb(tp)
+    assert ddlb.rect.size == expected.rect.size
+    assert ddlb.ddl.rect.size == expected.ddl.rect.size
+    shadow, expected_shadow = ddlb.ddl.shadows["normal"][0], expected.ddl.shadows["normal"][0]
+    assert (shadow is None) == (expected_shadow is None)
+    if shadow:
+        assert shadow.get_size() == expected_shadow.get_size()
+
+@pytest.mark.parametrize("name", sorted(STOCK_ELEMENTS))
+def test_stock_element_in_batch(tp, name):
+    build = STOCK_ELEMENTS[name]
+    expected = build(tp)
+    with tp.batch():
+        element = build(tp)
+    assert get_layout(element) == get_layout(expected)
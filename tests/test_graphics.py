@@ -0,0 +1,32 @@
+"""Round rects assembled from 9-slice templates must match the round rects rendered at full size."""
+import pygame
+import pytest
+
+SIZES = ((100, 40), (37, 21), (300, 301), (61, 200), (58, 122), (12, 12))
+COLORS = ((200, 100, 50), (10, 200, 30, 120))
+
+
+def render_full(graphics, color, size, radius, n_smooth):
+    """Round rect rendered at the size of the rect, as before the templates."""
+    radius = graphics.get_round_rect_radius(size, radius, False, n_smooth)
+    surface = pygame.Surface(size, flags=pygame.SRCALPHA).convert_alpha()
+    surface.blit(graphics.render_round_rect(n_smooth, color, size, radius), (0, 0))
+    return surface
+
+
+@pytest.mark.parametrize("n_smooth", (1, 1.25, 1.5, 2, 2.5, 3))
+@pytest.mark.parametrize("radius", (3, 10, 25, 0.3))
+def test_round_rect_is_exact(tp, n_smooth, radius):
+    graphics = tp.graphics
+    for color in COLORS:
+        for size in SIZES:
+            expected = render_full(graphics, color, size, radius, n_smooth)
+            sliced = graphics.round_rect_aa(color, size, radius, False, n_smooth)
+            assert sliced.get_size() == expected.get_size()
+            assert (graphics.get_rgba_array(sliced) == graphics.get_rgba_array(expected)).all()
+
+def test_templates_cache_is_bounded(tp):
+    graphics = tp.graphics
+    for radius in range(graphics.MAX_CACHED_ROUND_RECTS + 10):
+        graphics.round_rect_aa((0, 0, 0), (50, 50), radius/100, False, 1)
+    assert len(graphics.round_rect_templates) == graphics.MAX_CACHED_ROUND_RECTS
@@ -0,0 +1,46 @@
+"""Elements drawn from a cached layer must look like elements drawn directly."""
+import pygame
+import pytest
+
+
+def build_box(tp):
+    buttons = [tp.Button("Label %d"%i) for i in range(4)]
+    inner = tp.Box([tp.TextInput("ab", "x"), tp.Checkbox(True), tp.Slider("h", 100)])
+    box = tp.TitleBox("Inventory", [tp.Group(buttons, "grid"), inner])
+    box.set_topleft(40, 30)
+    box.generate_shadow()
+    return box, inner
+
+def draw(box):
+    screen = pygame.display.get_surface()
+    screen.fill((30, 60, 90))
+    pygame.draw.circle(screen, (200, 200, 40), (200, 150), 100)
+    box.draw()
+    return pygame.surfarray.array3d(screen).astype(int)
+
+
+@pytest.mark.parametrize("theme", ("theme_human", "theme_round", "theme_game1", "theme_game2", "theme_round2"))
+def test_layer_looks_like_direct_drawing(tp, theme):
+    getattr(tp, theme)()
+    try:
+        box, inner = build_box(tp)
+        expected = draw(box)
+        box.set_layer(True)
+        inner.set_layer(True) #nested layer
+        layered = draw(box)
+        assert box.layer is not None and inner.layer is not None
+        assert abs(expected - layered).max() <= 2 #rounding of the premultiplied alpha
+    finally:
+        tp.theme_human()
+
+def test_custom_draw_is_not_drawn_in_layer(tp):
+    box, inner = build_box(tp)
+    drawn = []
+    def custom_draw():
+        pygame.draw.rect(inner.surface, (255, 0, 0), inner.rect, 1)
+        drawn.append(inner)
+    inner.draw = custom_draw
+    box.set_layer(True)
+    draw(box)
+    assert box.layer is None
+    assert drawn == [inner]
@@ -4,11 +4,10 @@ from .elements import TextInput, Slider, Image, Helper, Checkbox, Radio, SwitchB
 from .elements import DeadButton, _DropDownButton, _LabelButton, _DraggerButton, _SliderBar, _ColorFrameForColorPicker
 from .elements import ColorPicker, ColorPickerRGB, SwitchButtonWithText, _ButtonColor, OutlinedText, _SelectButton
 from .graphics import darken, enlighten, change_alpha
-from thorpy import graphics
+from . import graphics
 from .shadows import propose_shadowgen
 from . import parameters as p
-
-import thorpy
+from . import loops
 
 all_classes = [Box, TitleBox, Button, Text, Line, DropDownList,
                 TextInput, Slider, Image, Helper, Checkbox, Radio, SwitchButton, ToggleButton, DeadButton,
@@ -742,7 +741,7 @@ def refresh_all_states_style(element, recursive=True):
 
 def refresh_all_elements_style(root=None):
     if root is None:
-        root = thorpy.get_current_loop().element
+        root = loops.get_current_loop().element
         if not root:
             raise Exception("Couldn't detect a root element. You should indicate one.")
     for e in root.get_all_descendants():
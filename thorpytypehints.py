@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Sequence, Literal
+from typing import Sequence, Literal, Union
 import pygame
 from pygame.math import Vector2 as V2
 
@@ -32,4 +32,4 @@ GradientColor = RGB_OR_RGBA | tuple[RGB_OR_RGBA_SEQ, str] | RGB_OR_RGBA_SEQ
 PygCol = Literal['P', 'RGB', 'RGBX', 'RGBA', 'ARGB', 'BGRA', 'RGBA_PREMULT', 'ARGB_PREMULT']
 PygCol2 = Literal['P', 'RGB', 'RGBX', 'RGBA', 'ARGB', 'BGRA']
 
-RectOrElement = pygame.Rect | "Element"
\ No newline at end of file
+RectOrElement = Union[pygame.Rect, "Element"]
\ No newline at end of file
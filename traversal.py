@@ -0,0 +1,151 @@
+"""Flat, precompiled traversal of a tree of elements. See Element.set_compiled_traversal."""
+from typing import Callable, Dict, List, TYPE_CHECKING
+if TYPE_CHECKING:
+    from .canonical import Element
+
+from . import parameters as p
+
+
+class CompiledTree:
+    """Flat arrays of the descendants of a root element, used to update, draw and move them
+    without recursion. The arrays are rebuilt when children are added or removed in the tree."""
+
+    def __init__(self, root:"Element"):
+        self.root = root
+        #nodes in pre-order with reversed children : reading the array backward gives the order of
+        #the recursive update (children first), and each subtree is a contiguous slice.
+        self.nodes:List["Element"] = []
+        self.end:List[int] = [] #index following the subtree of each node
+        self.parents:List[int] = [] #index of the parent of each node (-1 for root)
+        self.index:Dict["Element",int] = {}
+        self.update_opaque:List[bool] = [] #nodes updating their subtree themselves
+        self.update_calls:List[Callable] = []
+        self.animation_opaque:List[bool] = []
+        self.animation_calls:List[Callable] = []
+        self.draw_calls:List[Callable] = []
+        self.must_rebuild:bool = True
+
+    def rebuild(self)->None:
+        for e in self.nodes:
+            e.compiled_tree = None
+        self.nodes.clear()
+        self.end.clear()
+        self.parents.clear()
+        self.index.clear()
+        self.update_opaque.clear()
+        self.update_calls.clear()
+        self.animation_opaque.clear()
+        self.animation_calls.clear()
+        self.draw_calls.clear()
+        self.add_node(self.root, -1)
+        self.add_draw_calls(self.root)
+        self.must_rebuild = False
+
+    def add_node(self, e:"Element", parent:int)->None:
+        i = len(self.nodes)
+        self.nodes.append(e)
+        self.end.append(-1)
+        self.parents.append(parent)
+        self.index[e] = i
+        e.compiled_tree = self
+        is_root = e is self.root
+        if not is_root and e.has_custom_update():
+            self.update_opaque.append(True)
+            self.update_calls.append(e.update)
+        else:
+            self.update_opaque.append(False)
+            self.update_calls.append(e.update_state)
+        if not is_root and e.has_custom_update_no_state_change():
+            self.animation_opaque.append(True)
+            self.animation_calls.append(e.update_no_state_change)
+        else:
+            self.animation_opaque.append(False)
+            self.animation_calls.append(e.update_animation)
+        for c in reversed(e.children):
+            self.add_node(c, i)
+        self.end[i] = len(self.nodes)
+
+    def add_draw_calls(self, e:"Element")->None:
+        if e is not self.root and (e.is_layer or e.has_custom_draw()):
+            self.draw_calls.append(e.draw) #e draws its subtree itself
+            return
+        self.draw_calls.append(e.draw_self)
+        for c in e.children:
+            self.add_draw_calls(c)
+
+    def get_update_order(self, opaque:List[bool])->List[int]:
+        """_Returns the indices of the nodes to update, skipping locked subtrees and the subtrees
+        of opaque nodes. The order is the reverse of the update order."""
+        nodes, end = self.nodes, self.end
+        order = []
+        i, n = 0, len(nodes)
+        while i < n:
+            if nodes[i].state == "locked":
+                i = end[i]
+            else:
+                order.append(i)
+                if opaque[i]:
+                    i = end[i]
+                else:
+                    i += 1
+        return order
+
+    def update(self, mouse_delta)->bool:
+        if self.must_rebuild:
+            self.rebuild()
+        nodes, parents, opaque, calls = self.nodes, self.parents, self.update_opaque, self.update_calls
+        children_dragged = [False]*len(nodes)
+        dragged = False
+        for i in reversed(self.get_update_order(opaque)):
+            if opaque[i]:
+                dragged = calls[i](mouse_delta)
+            elif nodes[i].state == "locked": #locked by another element during this update
+                dragged = False
+            else:
+                dragged = calls[i](mouse_delta, children_dragged[i])
+            if dragged and parents[i] >= 0:
+                children_dragged[parents[i]] = True
+        return dragged #last node updated is root
+
+    def update_no_state_change(self, mouse_delta)->None:
+        if self.must_rebuild:
+            self.rebuild()
+        opaque, calls = self.animation_opaque, self.animation_calls
+        for i in reversed(self.get_update_order(opaque)):
+            if opaque[i]:
+                calls[i](mouse_delta)
+            else:
+                calls[i]()
+
+    def draw(self)->None:
+        if self.must_rebuild:
+            self.rebuild()
+        for f in self.draw_calls:
+            f()
+
+    def move(self, element:"Element", dx, dy)->None:
+        """Moves element and its subtree."""
+        i = self.index[element]
+        nodes = self.nodes[i:self.end[i]]
+        if p.dirty_rects is not None:
+            for e in nodes:
+                p.dirty_rects.append(e.get_damaged_rect())
+        layer = element.layer
+        element.mark_dirty() #invalidates the layers containing element
+        x, y = element.rect.topleft
+        for e in nodes:
+            e.rect.x += dx
+            e.rect.y += dy
+        shift = (element.rect.x - x, element.rect.y - y)
+        for e in nodes: #the layers inside the subtree moved as a whole
+            if e.layer:
+                e.layer_rect.move_ip(shift) #type:ignore #guaranteed when layer is defined
+        if layer and not element.cannot_draw_outside:
+            element.layer = layer
+            element.layer_rect.move_ip(shift) #type:ignore #guaranteed when layer is defined
+        hit_index = element.hit_index
+        if hit_index:
+            hit_index.stale.update([e for e in nodes if e.hit_index is hit_index])
+        if p.dirty_rects is not None:
+            for e in nodes:
+                p.dirty_rects.append(e.get_damaged_rect())